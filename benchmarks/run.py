@@ -0,0 +1,356 @@
+'''
+Benchmark suite for the lexer, parsers, interpreter, builtins and save files.
+Each benchmark is timed over several repeats of enough calls to take a measurable time, and the results are written
+as JSON, so runs on different commits can be compared. Only the standard library and numpy are needed.
+Run directly:
+    python benchmarks/run.py --output before.json
+    python benchmarks/run.py --compare before.json
+    python benchmarks/run.py --filter parse
+'''
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'scripts'))
+
+import numpy as np
+import Interpreter
+import Codegen
+import Function
+import Journal
+from Lexer import tokenize
+from Serialize import dump_save, load_save
+
+# Benchmarks by name. Each is a setup function returning the function to time.
+BENCHMARKS = {}
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+def polynomial(terms):
+    '''
+    Returns the source of a polynomial in x with the given number of terms, the shape of most inputs
+    '''
+    return ' + '.join('{} x^{}'.format(i + 1, i % 7) for i in range(terms))
+
+def new_interpreter():
+    return Interpreter.Interpreter.get_global_interpreter()
+
+@benchmark('lex_polynomial_500')
+def lex_polynomial():
+    source = polynomial(500)
+    return lambda: tokenize(source)
+
+@benchmark('parse_precedence_polynomial_500')
+def parse_precedence():
+    source = polynomial(500)
+    def run():
+        Interpreter.Interpreter.parser_backend = 'precedence'
+        Interpreter.Interpreter.parse(source)
+    return run
+
+@benchmark('parse_combinator_polynomial_20')
+def parse_combinator():
+    source = polynomial(20)
+    def run():
+        Interpreter.Interpreter.parser_backend = 'combinator'
+        try:
+            Interpreter.Interpreter.parse(source)
+        finally:
+            Interpreter.Interpreter.parser_backend = 'precedence'
+    return run
+
+@benchmark('parse_array_literal_5000')
+def parse_array_literal():
+    source = '[{}]'.format(', '.join(str(i) for i in range(5000)))
+    return lambda: Interpreter.Interpreter.parse(source)
+
+@benchmark('evaluate_polynomial_500')
+def evaluate_polynomial():
+    interpreter = new_interpreter()
+    interpreter.set_value('x', 1.5)
+    AST = Interpreter.Interpreter.parse(polynomial(500))
+    return lambda: interpreter.evaluate_AST(AST)
+
+@benchmark('evaluate_array_literal_5000')
+def evaluate_array_literal():
+    interpreter = new_interpreter()
+    AST = Interpreter.Interpreter.parse('[{}]'.format(', '.join(str(i) for i in range(5000))))
+    return lambda: interpreter.evaluate_AST(AST)
+
+@benchmark('evaluate_polynomial_function_call_1000')
+def evaluate_function_calls():
+    interpreter = new_interpreter()
+    interpreter.evaluate('p(x) = {}'.format(polynomial(10)))
+    AST = Interpreter.Interpreter.parse('p(2) + ' * 999 + 'p(2)')
+    return lambda: interpreter.evaluate_AST(AST)
+
+@benchmark('recursion_nontail_300')
+def recursion_nontail():
+    interpreter = new_interpreter()
+    interpreter.evaluate('k(n) = ifelse(n <= 0, 0, n + k(n - 1))')
+    AST = Interpreter.Interpreter.parse('k(300)')
+    return lambda: interpreter.evaluate_AST(AST)
+
+@benchmark('recursion_tail_10000')
+def recursion_tail():
+    interpreter = new_interpreter()
+    interpreter.evaluate('t(n, acc) = ifelse(n <= 0, acc, t(n - 1, acc + n))')
+    AST = Interpreter.Interpreter.parse('t(10000, 0)')
+    return lambda: interpreter.evaluate_AST(AST)
+
+@benchmark('fib_18')
+def fib():
+    interpreter = new_interpreter()
+    interpreter.evaluate('fib(n) = ifelse(n < 2, n, fib(n - 1) + fib(n - 2))')
+    AST = Interpreter.Interpreter.parse('fib(18)')
+    return lambda: interpreter.evaluate_AST(AST)
+
+def with_jit(setup):
+    '''
+    Returns a setup function timing the same calls with user functions lowered by Jit
+    '''
+    def jit_setup():
+        func = setup()
+        def run():
+            Function.UserFunction.jit = True
+            try:
+                func()
+            finally:
+                Function.UserFunction.jit = False
+        return run
+    return jit_setup
+
+benchmark('recursion_tail_10000_jit')(with_jit(recursion_tail))
+benchmark('fib_18_jit')(with_jit(fib))
+
+def script(lines):
+    '''
+    Returns the (line number, source) pairs of a script defining and using variables and functions
+    '''
+    programs = []
+    for i in range(lines):
+        if i % 4 == 0:
+            programs.append('v{} = {}'.format(i, polynomial(8).replace('x', str(i + 1))))
+        elif i % 4 == 1:
+            programs.append('g{}(x) = x^2 + {} x'.format(i, i))
+        else:
+            programs.append('g{}(v{}) + [1, 2, 3] sin(v{})'.format(i - i % 4 + 1, i - i % 4, i - i % 4))
+    return list(enumerate(programs, 1))
+
+@benchmark('run_script_200')
+def run_script():
+    programs = script(200)
+    def run():
+        # A new run of the script starts with nothing parsed
+        Interpreter.Interpreter.parse_cache.clear()
+        interpreter = new_interpreter()
+        for _, program in programs:
+            interpreter.evaluate(program)
+    return run
+
+@benchmark('run_script_200_codegen')
+def run_script_codegen():
+    programs = script(200)
+    path = os.path.join(tempfile.mkdtemp(), 'script.calc')
+    Codegen.load_programs(programs, path)
+    def run():
+        interpreter = new_interpreter()
+        for _, _, function in Codegen.load_programs(programs, path):
+            function(interpreter)
+    return run
+
+@benchmark('sum_elementwise_1000000')
+def sum_elementwise():
+    interpreter = new_interpreter()
+    AST = Interpreter.Interpreter.parse('sum(i, 1, 1000000, i^2 / 2 + sin(i))')
+    return lambda: interpreter.evaluate_AST(AST)
+
+@benchmark('sum_loop_5000')
+def sum_loop():
+    interpreter = new_interpreter()
+    interpreter.evaluate('g(i) = ifelse(i % 2 == 0, i, -i)')
+    AST = Interpreter.Interpreter.parse('sum(i, 1, 5000, g(i))')
+    return lambda: interpreter.evaluate_AST(AST)
+
+@benchmark('map_filter_reduce_10000')
+def higher_order():
+    interpreter = new_interpreter()
+    interpreter.evaluate('a = range(1, 10000)')
+    AST = Interpreter.Interpreter.parse('reduce(lambda((acc, x), acc + x), filter(lambda(x, x % 3 == 0), map(lambda(x, x^2), a)), 0)')
+    return lambda: interpreter.evaluate_AST(AST)
+
+def large_scope():
+    '''
+    Returns an interpreter holding many functions and a large array, like a shared library save
+    '''
+    interpreter = new_interpreter()
+    for i in range(1000):
+        interpreter.evaluate('f{0}(x) = x^2 + {0} sin(x) + (x + 1)(x - 2) / 3'.format(i))
+    interpreter.set_value('table', np.linspace(0, 1, 1000000))
+    return interpreter
+
+def save_load(extension, lazy):
+    interpreter = large_scope()
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'scope{}'.format(extension))
+    def run():
+        dump_save(interpreter.serialize(), path)
+        scope = Interpreter.Interpreter.deserialize(load_save(path), lazy=lazy)
+        Interpreter.Interpreter.get_global_interpreter(subscope=scope).evaluate('f7(table[10])')
+    return run
+
+@benchmark('save_load_json_large_scope')
+def save_load_json():
+    return save_load('.calc', False)
+
+@benchmark('save_load_binary_large_scope')
+def save_load_binary():
+    return save_load('.calcb', False)
+
+@benchmark('save_load_binary_lazy_large_scope')
+def save_load_binary_lazy():
+    return save_load('.calcb', True)
+
+@benchmark('journal_checkpoint_large_scope')
+def journal_checkpoint():
+    interpreter = large_scope()
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'scope.calcb')
+    Journal.write_save(interpreter.serialize(), path)
+    journal = Journal.Journal(path, interpreter._scope, compact_after=sys.maxsize)
+    def run():
+        interpreter.evaluate('g(x) = f3(x) + 1')
+        journal.checkpoint()
+    return run
+
+def time_benchmark(setup, repeat, min_time):
+    '''
+    Returns timing statistics for the function made by setup, in seconds per call
+    '''
+    func = setup()
+    func()
+
+    # Find the number of calls that takes at least min_time, as timeit does
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    times = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return {
+        'median': statistics.median(times),
+        'min': min(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'number': number,
+        'repeat': repeat
+    }
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, check=True,
+            capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old, new, threshold):
+    '''
+    Prints how the median time of each benchmark changed, returning the names of those that slowed down by more
+    than the threshold ratio
+    '''
+    regressions = []
+    print('{:<40} {:>12} {:>12} {:>8}'.format('benchmark', 'before', 'after', 'ratio'))
+    for name, result in new['results'].items():
+        if 'error' in result:
+            regressions.append(name)
+            print('{:<40} {:>12} {:>12} {:>8}'.format(name, '-', 'failed', '-'))
+            continue
+        elif name not in old['results'] or 'error' in old['results'][name]:
+            print('{:<40} {:>12} {:>12.3e} {:>8}'.format(name, '-', result['median'], '-'))
+            continue
+        before = old['results'][name]['median']
+        ratio = result['median'] / before if before > 0 else float('inf')
+        flag = ''
+        if ratio > threshold:
+            regressions.append(name)
+            flag = ' slower'
+        print('{:<40} {:>12.3e} {:>12.3e} {:>8.2f}{}'.format(name, before, result['median'], ratio, flag))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the calculator benchmarks')
+    parser.add_argument('-o', '--output', help='file to write the results to as JSON, instead of standard output')
+    parser.add_argument('-c', '--compare', help='results of an earlier run to compare against')
+    parser.add_argument('-k', '--filter', help='only run benchmarks whose names contain this text')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='number of timed repeats of each benchmark')
+    parser.add_argument('--min-time', type=float, default=0.1, help='minimum time of each repeat in seconds')
+    parser.add_argument('--threshold', type=float, default=1.1, help='ratio of medians counted as a regression when comparing')
+    parser.add_argument('--list', action='store_true', help='list the benchmarks and exit')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print('\n'.join(BENCHMARKS))
+        return 0
+
+    # Repeated calls should measure evaluation rather than memoized results, and deep recursion needs room
+    Function.UserFunction.memo_size = 0
+    sys.setrecursionlimit(100000)
+
+    # A benchmark that fails is reported with its error, so it cannot go unnoticed while the others still run
+    results = {}
+    failures = 0
+    for name, setup in BENCHMARKS.items():
+        if args.filter is not None and args.filter not in name:
+            continue
+        Interpreter.Interpreter.parse_cache.clear()
+        try:
+            results[name] = time_benchmark(setup, args.repeat, args.min_time)
+        except Exception as err:
+            failures += 1
+            results[name] = {'error': '{}: {}'.format(type(err).__name__, err)}
+            print('{:<40} failed with {}'.format(name, results[name]['error']), file=sys.stderr)
+            continue
+        print('{:<40} {:.3e}s'.format(name, results[name]['median']), file=sys.stderr)
+
+    report = {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'results': results
+    }
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    elif args.compare is None:
+        print(json.dumps(report, indent=2))
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            old = json.load(f)
+        if len(compare(old, report, args.threshold)) > 0:
+            return 1
+    return 1 if failures > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
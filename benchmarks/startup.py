@@ -0,0 +1,64 @@
+'''
+Measures startup latency in fresh processes: importing the interpreter and the Calculator module, creating an
+interpreter, and evaluating a first and second input. Prints the median of each over several runs as JSON.
+Run directly: python benchmarks/startup.py, or: python benchmarks/startup.py --runs 20
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'scripts')
+
+# Run in a fresh interpreter for each measurement, so that nothing is imported or cached beforehand
+CHILD = '''
+import json, sys, time
+sys.path.insert(0, {scripts!r})
+times = {{}}
+start = time.perf_counter()
+import numpy
+times['import_numpy'] = time.perf_counter() - start
+start = time.perf_counter()
+import Interpreter
+times['import_interpreter'] = time.perf_counter() - start
+start = time.perf_counter()
+import Calculator
+times['import_calculator'] = time.perf_counter() - start
+start = time.perf_counter()
+interpreter = Interpreter.Interpreter.get_global_interpreter()
+times['first_interpreter'] = time.perf_counter() - start
+start = time.perf_counter()
+Interpreter.Interpreter.get_global_interpreter()
+times['second_interpreter'] = time.perf_counter() - start
+start = time.perf_counter()
+interpreter.evaluate('f(x) = x^2 + 2 x + 1 ; f(3)')
+times['first_evaluation'] = time.perf_counter() - start
+start = time.perf_counter()
+interpreter.evaluate('f(4) + sin(pi / 2)')
+times['second_evaluation'] = time.perf_counter() - start
+print(json.dumps(times))
+'''
+
+def measure(runs):
+    '''
+    Returns the median of each timing, in seconds, over the given number of fresh processes
+    '''
+    samples = {}
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', CHILD.format(scripts=SCRIPTS_DIR)],
+            check=True, capture_output=True, text=True).stdout
+        for name, value in json.loads(output).items():
+            samples.setdefault(name, []).append(value)
+    return {name: statistics.median(values) for name, values in samples.items()}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure the startup latency of the calculator')
+    parser.add_argument('--runs', type=int, default=10, help='number of fresh processes to measure')
+    args = parser.parse_args(argv)
+    print(json.dumps({'runs': args.runs, 'seconds': measure(args.runs)}, indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
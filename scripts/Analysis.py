@@ -0,0 +1,161 @@
+import numpy as np
+import Function
+
+# Types of values that broadcast against an array of indices the same way they combine with a single index
+SCALAR_TYPES = (bool, int, float, np.number, np.bool_)
+
+def get_name(name_node):
+    '''
+    Returns the dotted name of a name node
+    '''
+    return '.'.join([arg[0].value for arg in name_node[1:]])
+
+def is_elementwise(AST, scope, index_name):
+    '''
+    Determines whether evaluating an expression once with index_name bound to an array of indices gives the same
+    values as evaluating it once per index. This holds for expressions built from numbers, scalar variables, operators
+    and builtins marked as elementwise. Other names are looked up in the given scope.
+    '''
+    def check(node):
+        if len(node) < 2:
+            return False
+        label = node[0]
+        args = node[1:]
+        if label == 'expression':
+            return args[0] != () and check(args[0])
+        elif label == 'infix' or label == 'implicit_mult':
+            return all(check(arg) for arg in args)
+        elif label == 'operator':
+            return True
+        elif label == 'operand':
+            # A leaf can only be a number
+            if len(args) == 1 and len(args[0]) == 1:
+                return True
+            return all(check(arg) for arg in args)
+        elif label == 'name':
+            name = get_name(node)
+            if name == index_name:
+                return True
+            try:
+                value = scope.retrieve_value(name)
+            except ValueError:
+                return False
+            return isinstance(value, SCALAR_TYPES)
+        elif label == 'function_call':
+            if len(args) != 2 or args[0][0] != 'name' or args[1][0] != 'params' or args[1][1:] == ((),):
+                return False
+            name = get_name(args[0])
+            if name == index_name:
+                return False
+            try:
+                function = scope.retrieve_value(name)
+            except ValueError:
+                return False
+            if not isinstance(function, Function.BuiltinFunction) or not function.is_elementwise():
+                return False
+            return all(check(param) for param in args[1][1:])
+        else:
+            return False
+    return check(AST)
+
+def is_elementwise_function(function):
+    '''
+    Determines whether calling a single parameter function once on an array gives the same values as calling it on
+    each element. User functions are checked against the scope they were defined in.
+    '''
+    param_names = function.get_param_names()
+    if len(param_names) != 1:
+        return False
+    if isinstance(function, Function.BuiltinFunction):
+        return function.is_elementwise()
+    elif isinstance(function, Function.UserFunction):
+        # A parameter named self is shadowed by the function itself
+        if param_names[0] == 'self':
+            return False
+        return is_elementwise(function.get_definition(), function.get_parent_scope(), param_names[0])
+    else:
+        return False
+
+def get_bare_words(expression):
+    '''
+    Returns the words of an expression consisting of a single word or a word list, possibly in brackets, or None for
+    any other expression. This follows Interpreter.get_word_list, which builtins use to read such arguments.
+    '''
+    node = expression
+    while len(node) == 2 and node[0] in ('expression', 'infix', 'operand'):
+        node = node[1]
+        if node == ():
+            return []
+    if node[0] == 'word_list':
+        return [] if node[1:] == ((),) else [word[0].value for word in node[1:]]
+    elif node[0] == 'name' and len(node) == 2:
+        return [node[1][0].value]
+    return None
+
+def get_binder_names(AST):
+    '''
+    Returns the names that a builtin called within the tree may bind in a scope of its own, such as the index of a
+    sum or the parameters of a lambda. These are the words passed alone or as word lists as arguments to any call.
+    '''
+    names = set()
+    def visit(node):
+        if type(node) != tuple or len(node) == 0 or type(node[0]) != str:
+            return
+        if node[0] == 'params':
+            for arg in node[1:]:
+                if arg != ():
+                    words = get_bare_words(arg)
+                    if words is not None:
+                        names.update(words)
+        for arg in node[1:]:
+            visit(arg)
+    visit(AST)
+    return names
+
+def get_dependencies(function):
+    '''
+    Returns the (name, value) pairs of the names a user function reads from outside its frame, including those read
+    by the user functions it calls, or None if the function is not pure. A pure function creates no lambdas, deletes
+    no names and reads only values and pure functions.
+    '''
+    dependencies = []
+    visited = {}
+
+    def check_value(value):
+        if isinstance(value, Function.UserFunction):
+            return check_function(value)
+        elif isinstance(value, Function.BuiltinFunction):
+            return value.is_pure()
+        else:
+            return True
+
+    def check_function(function):
+        # Functions being checked are assumed pure, which lets recursive functions be pure
+        if id(function) in visited:
+            return True
+        visited[id(function)] = function
+        local_names = set(function.get_param_names())
+        local_names.add('self')
+        binder_names = get_binder_names(function.get_definition())
+        scope = function.get_parent_scope()
+
+        def check(node):
+            if type(node) != tuple or len(node) == 0 or type(node[0]) != str:
+                return True
+            if node[0] == 'name':
+                name = get_name(node)
+                if name in local_names:
+                    return True
+                owner = scope.find_owner(name) if scope is not None else None
+                if owner is None:
+                    # The name can only be defined by the builtin binding it
+                    return name in binder_names
+                value = owner.retrieve_value(name)
+                dependencies.append((name, value))
+                return check_value(value)
+            return all(check(arg) for arg in node[1:])
+        return check(function.get_definition())
+
+    if check_function(function):
+        return dependencies
+    return None
@@ -0,0 +1,185 @@
+'''
+Evaluates programs from files or standard input without the interactive prompt, for use in pipelines.
+Each line is evaluated as soon as it is read. A line ending with ';' continues on the next line, so a program spread
+over several lines is evaluated as a whole. Results are written to standard output as text, one line per program, or
+as JSON Lines. An error is reported for the program that caused it and evaluation continues with the next one.
+With --compile, the programs of a file are generated as Python code by Codegen and cached next to the file, so running
+the same file again skips parsing.
+Run directly: python Batch.py program.calc, or: echo "1 + 2" | python Batch.py --format jsonl
+'''
+import argparse
+import json
+import sys
+import time
+import numpy as np
+import Codegen
+import Interpreter
+import Journal
+import Parallel
+from History import History
+from Scope import NoNewline
+from Serialize import plain_value
+
+def read_programs(lines):
+    '''
+    Yields (line number, program) pairs from an iterable of lines, joining lines that end with ';' to the next one
+    '''
+    pending = []
+    start = None
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if start is None:
+            start = number
+        pending.append(line)
+        if not line.rstrip().endswith(';'):
+            yield start, '\n'.join(pending)
+            pending = []
+            start = None
+    if len(pending) > 0:
+        yield start, '\n'.join(pending)
+
+def load_interpreter(path=None):
+    '''
+    Returns an interpreter whose scope is loaded from the given save file, or a fresh one if there is no path
+    '''
+    if path is None:
+        return Interpreter.Interpreter.get_global_interpreter()
+    scope = Journal.load_scope(path)
+    return Interpreter.Interpreter.get_global_interpreter(subscope=scope)
+
+class BatchRunner():
+    '''
+    Evaluates programs one after the other in the same scope, recording each answer in ans like the prompt does
+    '''
+    def __init__(self, interpreter, deep_recursion=False, history_length=None):
+        self._interpreter = interpreter
+        self._deep_recursion = deep_recursion
+        self._history = History(interpreter.retrieve_value('ans'), maxlen=history_length)
+        self.programs = 0
+        self.errors = 0
+
+    def evaluate(self, program, function=None):
+        '''
+        Returns the result of the program and None, or None and the error message if it failed
+        function:   The program's function generated by Codegen, which is run instead of interpreting the program
+        '''
+        self.programs += 1
+        result = None
+        error = None
+        try:
+            if function is not None:
+                if self._deep_recursion:
+                    result = Interpreter.Interpreter.run_deep(function, self._interpreter)
+                else:
+                    result = function(self._interpreter)
+            elif self._deep_recursion:
+                result = self._interpreter.evaluate_deep(program)
+            else:
+                result = self._interpreter.evaluate(program)
+        except NoNewline:
+            pass
+        except Exception as err:
+            self.errors += 1
+            error = str(err) if str(err) != '' else type(err).__name__
+
+        if result is None or error is not None:
+            self._history.append(np.nan)
+        else:
+            self._history.append(result)
+        self._interpreter.get_root_scope().set_value('ans', self._history.values(), force=True)
+        return result, error
+
+def format_text(number, program, result, error):
+    if error is not None:
+        return 'Error on line {}: {}'.format(number, error)
+    elif result is None:
+        return ''
+    else:
+        return str(result)
+
+def format_json(number, program, result, error):
+    return json.dumps({
+        'line': number,
+        'source': program,
+        'result': plain_value(result),
+        'error': error
+    })
+
+def run_bindings(args, formatter):
+    '''
+    Evaluates the programs of the given files as one program for each set of bindings, in parallel.
+    Each output line is numbered by the line of its bindings.
+    '''
+    programs = []
+    for path in args.files:
+        f = sys.stdin if path == '-' else open(path, 'r')
+        try:
+            programs.extend(program for _, program in read_programs(f))
+        finally:
+            if path != '-':
+                f.close()
+    program = ' ;\n'.join(programs)
+    with open(args.bindings, 'r') as f:
+        bindings = [json.loads(line) for line in f if line.strip() != '']
+
+    start_time = time.perf_counter()
+    results = Parallel.evaluate_many(program, bindings, scope=load_interpreter(args.load)._scope, max_workers=args.jobs)
+    errors = 0
+    for number, (result, error) in enumerate(results, 1):
+        if error is not None:
+            errors += 1
+        print(formatter(number, json.dumps(bindings[number - 1]), result, error))
+
+    if args.stats:
+        elapsed = time.perf_counter() - start_time
+        rate = len(results) / elapsed if elapsed > 0 else float('inf')
+        print('{} binding sets, {} errors in {:.3f}s ({:.0f} per second)'.format(len(results), errors, elapsed, rate), file=sys.stderr)
+    return 1 if errors > 0 else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Evaluate calculator programs without the interactive prompt')
+    parser.add_argument('files', nargs='*', default=['-'], help='files to evaluate in order, or - for standard input (the default)')
+    parser.add_argument('-f', '--format', choices=['text', 'jsonl'], default='text', help='output format')
+    parser.add_argument('-l', '--load', help='save file whose scope to start from')
+    parser.add_argument('--deep', action='store_true', help='evaluate on a thread with a large stack for deep recursion')
+    parser.add_argument('--compile', action='store_true', help='generate Python code for the programs of each file, cached next to the file')
+    parser.add_argument('--stats', action='store_true', help='print throughput statistics to standard error when done')
+    parser.add_argument('-b', '--bindings', help='JSON Lines file of objects mapping names to values. The files are evaluated as one program for each object.')
+    parser.add_argument('-j', '--jobs', type=int, help='number of processes evaluating bindings, defaulting to the number of CPUs')
+    args = parser.parse_args(argv)
+
+    formatter = format_json if args.format == 'jsonl' else format_text
+    if args.bindings is not None:
+        return run_bindings(args, formatter)
+
+    runner = BatchRunner(load_interpreter(args.load), deep_recursion=args.deep)
+    start_time = time.perf_counter()
+    for path in args.files:
+        streaming = path == '-'
+        f = sys.stdin if streaming else open(path, 'r')
+        try:
+            if args.compile and not streaming:
+                programs = Codegen.load_programs(read_programs(f), path)
+            elif args.compile:
+                # Programs read from a pipe are generated one at a time as they come, and not cached
+                programs = ((number, program, Codegen.load_programs([(number, program)])[0][2]) for number, program in read_programs(f))
+            else:
+                programs = ((number, program, None) for number, program in read_programs(f))
+            for number, program, function in programs:
+                result, error = runner.evaluate(program, function)
+                # Flush results as they come when reading from a pipe, so downstream consumers see them immediately
+                print(formatter(number, program, result, error), flush=streaming)
+        finally:
+            if not streaming:
+                f.close()
+
+    if args.stats:
+        elapsed = time.perf_counter() - start_time
+        rate = runner.programs / elapsed if elapsed > 0 else float('inf')
+        cache = Interpreter.Interpreter.parse_cache.stats()
+        print('{} programs, {} errors in {:.3f}s ({:.0f} programs/s), parse cache {} hits {} misses'.format(
+            runner.programs, runner.errors, elapsed, rate, cache['hits'], cache['misses']), file=sys.stderr)
+    return 1 if runner.errors > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
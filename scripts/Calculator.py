@@ -1,33 +1,37 @@
 # #!/usr/bin/env python 
-from json.decoder import JSONDecodeError
 import Interpreter
+import Function
+import Journal
 import sys
 import os
 import traceback
 import re
-import asyncio
-import selectors
 # import atexit
-import json
-import yaml
 import argparse
 import numpy as np
 from Scope import NoNewline
-from Serialize import ProgramEncoder, json_program_obj_hook
-from prompt_toolkit import PromptSession
-from prompt_toolkit.application import run_in_terminal
-from prompt_toolkit.key_binding import KeyBindings
-from prompt_toolkit.shortcuts import input_dialog, checkboxlist_dialog, radiolist_dialog
-from prompt_toolkit.styles import Style
+from History import History
+
+# prompt_toolkit and yaml are imported where they are first needed, since importing them takes longer than the rest
+# of startup. Importing this module for its helpers stays cheap.
 
 CWD = os.path.dirname(os.path.realpath(__file__))
 SAVE_DIR = os.path.join(os.path.split(CWD)[0], 'saves')
 EXIT_DIALOG = True
-DIALOG_STYLE = Style.from_dict({
-    'dialog':             'bg:#88ff88',
-    'dialog frame.label': 'bg:#ffffff #000000',
-    'dialog':        'bg:#000000',
-})
+journal = None
+load_path = None
+DIALOG_STYLE = None
+
+def get_dialog_style():
+    global DIALOG_STYLE
+    if DIALOG_STYLE is None:
+        from prompt_toolkit.styles import Style
+        DIALOG_STYLE = Style.from_dict({
+            'dialog':             'bg:#88ff88',
+            'dialog frame.label': 'bg:#ffffff #000000',
+            'dialog':        'bg:#000000',
+        })
+    return DIALOG_STYLE
 
 def find_files(*sources, name=None, extension=None):
     '''
@@ -77,30 +81,31 @@ def find_saves(path):
     dirs = os.listdir(path)
     saves = []
     for f in dirs:
-        if os.path.isfile(os.path.join(SAVE_DIR, f)) and os.path.splitext(f)[1] == '.calc':
+        if os.path.isfile(os.path.join(SAVE_DIR, f)) and os.path.splitext(f)[1] in ('.calc', '.calcb'):
             saves.append(os.path.join(SAVE_DIR, f))
     saves = sorted(saves, key=os.path.getmtime, reverse=True)
     return saves
 
 def load(path):
     if os.path.isfile(path):
-        f = open(path, 'r')
         try:
-            scope = Interpreter.Interpreter.deserialize(json.load(f, object_hook=json_program_obj_hook))
-            f.close()
+            scope = Journal.load_scope(path)
             return Interpreter.Interpreter.get_global_interpreter(interface=True, subscope=scope)
-        except JSONDecodeError:
+        except ValueError:
             return Interpreter.Interpreter.get_global_interpreter(interface=True)
     else:
         return Interpreter.Interpreter.get_global_interpreter(interface=True)
 
 def save(path):
-    f = open(path, 'w')
-    json.dump(interpreter.serialize(), f, cls=ProgramEncoder)
-    f.close()
+    # Saving back to a journaled save only appends what changed since the last checkpoint
+    if journal is not None and os.path.normpath(path) == os.path.normpath(load_path):
+        journal.checkpoint()
+    else:
+        Journal.write_save(interpreter.serialize(), path)
 
 def onexit(load_path=None):
     global EXIT_DIALOG
+    from prompt_toolkit.shortcuts import input_dialog, radiolist_dialog
     # Give the option to save the scope before exiting
     if EXIT_DIALOG:
         NEW_SAVE = 1
@@ -118,13 +123,13 @@ def onexit(load_path=None):
             title='Save',
             text='Would you like to save your work?',
             values=values,
-            style=DIALOG_STYLE
+            style=get_dialog_style()
         ).run()
         if save_path == NEW_SAVE:
             app = input_dialog(
                 title='New save',
                 text='Please enter the save path',
-                style=DIALOG_STYLE
+                style=get_dialog_style()
             )
             app.current_buffer.insert_text(os.path.normpath(os.path.join(SAVE_DIR, 'new_save.calc')))
             save_path = app.run()
@@ -137,7 +142,7 @@ def onexit(load_path=None):
                     app = input_dialog(
                         title='New save',
                         text='Given path was not to a file. Please enter a corrected save path',
-                        style=DIALOG_STYLE
+                        style=get_dialog_style()
                     )
                     app.current_buffer.insert_text(save_path)
                     save_path = app.run()
@@ -146,26 +151,35 @@ def onexit(load_path=None):
                     if not save_path:
                         done_saving = True
                 else:
-                    # Add the proper extension if necessary and save
+                    # Add the proper extension if necessary and save. Saves ending with .calcb use the binary format.
                     save_name, save_ext = os.path.splitext(save_path)
-                    if save_ext != '.calc':
+                    if save_ext not in ('.calc', '.calcb'):
                         save_path = '{}.calc'.format(save_name)
                     save(save_path)
                     done_saving = True
 
-selector = selectors.SelectSelector()
-loop = asyncio.SelectorEventLoop(selector)
-asyncio.set_event_loop(loop)
+def get_key_bindings():
+    '''
+    Sets up the event loop that prompt_toolkit runs in and returns the key bindings of the prompt
+    '''
+    import asyncio
+    import selectors
+    from prompt_toolkit.key_binding import KeyBindings
+
+    selector = selectors.SelectSelector()
+    loop = asyncio.SelectorEventLoop(selector)
+    asyncio.set_event_loop(loop)
 
-bindings = KeyBindings()
+    bindings = KeyBindings()
 
-@bindings.add('s-down')
-def _(event):
-    event.app.current_buffer.insert_text('\n')
+    @bindings.add('s-down')
+    def _(event):
+        event.app.current_buffer.insert_text('\n')
 
-@bindings.add('s-tab')
-def _(event):
-    event.app.current_buffer.insert_text('    ')
+    @bindings.add('s-tab')
+    def _(event):
+        event.app.current_buffer.insert_text('    ')
+    return bindings
 
 # atexit.register(onexit)
 
@@ -174,18 +188,42 @@ if __name__ == '__main__':
     parser.add_argument('-d', '--debug', action='store_true', help='prints abstract syntax trees for inputs')
     parser.add_argument('-c', '--config', help='Name of the config yaml file to use', default='../config.yml')
     args = parser.parse_args()
+    from prompt_toolkit import PromptSession
+    from prompt_toolkit.shortcuts import radiolist_dialog
+    bindings = get_key_bindings()
 
     # Retrieve save files from configuration file if possible, falling back to the default save path if necessary
     saves = []
+    deep_recursion = False
+    history_length = None
+    journal_saves = False
+    autosave_lines = None
     config_path = os.path.join(CWD, args.config)
     if os.path.isfile(config_path):
+        import yaml
         config = yaml.safe_load(open(config_path, 'r'))
         basepath = os.path.dirname(config_path)
         if 'dirs' in config:
             save_dirs = [os.path.join(basepath, save_dir) for save_dir in config['dirs']] + [SAVE_DIR]
         else:
             save_dirs = [SAVE_DIR]
-        saves = list(find_files(*save_dirs, extension=r'\.calc'))
+        saves = list(find_files(*save_dirs, extension=r'\.calcb?'))
+        if 'parser' in config:
+            Interpreter.Interpreter.set_parser_backend(config['parser'])
+        if 'parse_cache_size' in config:
+            Interpreter.Interpreter.parse_cache.maxsize = config['parse_cache_size']
+        if 'deep_recursion' in config:
+            deep_recursion = config['deep_recursion']
+        if 'memo_size' in config:
+            Function.UserFunction.memo_size = config['memo_size']
+        if 'jit' in config:
+            Function.UserFunction.jit = config['jit']
+        if 'history_length' in config:
+            history_length = config['history_length']
+        if 'journal_saves' in config:
+            journal_saves = config['journal_saves']
+        if 'autosave_lines' in config:
+            autosave_lines = config['autosave_lines']
 
     # Find any saves and give the option to load them
     # saves = find_saves(SAVE_DIR)
@@ -194,16 +232,21 @@ if __name__ == '__main__':
             title='Load',
             text='The following save files were found. Which would you like to load?',
             values=[(save, os.path.split(save)[1]) for save in saves],
-            style=DIALOG_STYLE
+            style=get_dialog_style()
         ).run()
     else:
         save_path = None
 
+    load_path = save_path
+    journal = None
     if save_path:
         interpreter = load(save_path)
+        if journal_saves:
+            journal = Journal.Journal(save_path, interpreter._scope)
     else:
         interpreter = Interpreter.Interpreter.get_global_interpreter(interface=True)
         
+    history = History(interpreter.retrieve_value('ans'), maxlen=history_length)
     current_line = 0
     print('Enter expression:')
     sys.setrecursionlimit(3000)
@@ -224,7 +267,12 @@ if __name__ == '__main__':
             if args.debug:
                 AST = interpreter._get_AST(program)
                 print(AST)
-                result = interpreter.evaluate_AST(AST)
+                if deep_recursion:
+                    result = Interpreter.Interpreter.run_deep(interpreter.evaluate_AST, AST)
+                else:
+                    result = interpreter.evaluate_AST(AST)
+            elif deep_recursion:
+                result = interpreter.evaluate_deep(program)
             else:
                 result = interpreter.evaluate(program)
         except ValueError as err:
@@ -253,10 +301,16 @@ if __name__ == '__main__':
             print('Enter expression:')
         
         # Save answers in a variable
-        answers = interpreter.retrieve_value('ans')
         if result is None or type(result) == str:
-            answers = np.array(answers.tolist() + [np.nan], dtype=object)
+            history.append(np.nan)
         else:
-            answers = np.array(answers.tolist() + [result], dtype=object)
-        answers = interpreter.get_root_scope().set_value('ans', answers, force=True)
+            history.append(result)
+        interpreter.get_root_scope().set_value('ans', history.values(), force=True)
+
+        # Append what changed to the journal every few lines
+        if journal is not None and autosave_lines and current_line % autosave_lines == 0:
+            try:
+                journal.checkpoint()
+            except Exception as err:
+                print('Autosave failed: {}'.format(err))
     onexit(save_path)
\ No newline at end of file
@@ -0,0 +1,457 @@
+'''
+Generates the source of a Python module from whole programs, so that CPython's own bytecode interpreter does the work
+of the tree walking interpreter. Each program becomes a function of an interpreter, in which
+    var_def         becomes assignments of the value to the names in the interpreter's scope
+    function_def    becomes a user function of the definition, which compiles its body when called
+    infix           becomes calls of the operator functions in Operators, which compute floats natively and anything
+                    else with numpy
+Operands are computed into temporaries in the order the interpreter evaluates them, so values, errors and warnings are
+the same. Arguments of calls become functions of their own, wrapped with their abstract syntax tree for the builtins
+that need it. The trees are stored in the module marshalled to bytes, so nothing is parsed when it is run.
+A program holding a node the generator does not handle is evaluated from its tree by the interpreter instead, and one
+too deeply nested to generate or compile is evaluated from its source. Each program is compiled on its own, so such a
+program does not keep the others of its script from being generated.
+
+The code of a script is cached in a __pycache__ directory next to it, along with the hash of the script's source, so
+running the same script again skips parsing, generation and compilation.
+'''
+import hashlib
+import marshal
+import math
+import os
+import sys
+import numpy as np
+import Interpreter
+import Function
+import Compiler
+import Jit
+import Operators
+from Lexer import Token
+
+class CodegenError(Exception):
+    '''
+    Raised when an abstract syntax tree contains a node the generator does not handle in its position
+    '''
+    pass
+
+# Changed whenever the generated code changes, so that code cached by an earlier version is generated again
+VERSION = 2
+
+# Start of cached code files, followed by the hash of the source and the marshalled programs
+MAGIC = b'CALCC\x00\x02\n'
+
+def to_constants(AST):
+    '''
+    Returns the tree as nested tuples of constants, with each token as a tuple of None, its kind and its value
+    '''
+    if type(AST) is Token:
+        return (None, AST.kind, AST.value)
+    elif type(AST) == tuple:
+        return tuple(to_constants(elem) for elem in AST)
+    return AST
+
+def from_constants(AST):
+    if type(AST) == tuple:
+        if len(AST) == 3 and AST[0] is None:
+            return Token(AST[1], AST[2])
+        return tuple(from_constants(elem) for elem in AST)
+    return AST
+
+def encode_AST(AST):
+    '''
+    Returns the tree marshalled to bytes. Raises ValueError or RecursionError if it is too deeply nested.
+    '''
+    return marshal.dumps(to_constants(AST))
+
+def decode_AST(data):
+    '''
+    Rebuilds a tree encoded by encode_AST
+    '''
+    return from_constants(marshal.loads(data))
+
+def literal(value):
+    '''
+    Returns Python source for a constant
+    '''
+    if type(value) == float and not math.isfinite(value):
+        return 'float({!r})'.format(repr(value))
+    return repr(value)
+
+def valid_value(value, error_msg, allow_none=False):
+    if type(value) == list:
+        raise ValueError(error_msg.format(' word list'))
+    elif value is None and not allow_none:
+        raise ValueError(error_msg.format('n empty expression'))
+    return value
+
+def single_array(value):
+    if value == None:
+        return np.array([])
+    return np.array([value])
+
+def index_value(value, index):
+    if type(value) == np.ndarray:
+        int_array = Interpreter.Interpreter.to_ints(index, 'An array can only be indexed with integers')
+        return value[tuple(int_array)]
+    return np.multiply(value, index)
+
+def make_namespace():
+    '''
+    Returns the globals generated code runs with
+    '''
+    namespace = {
+        'np': np,
+        '_decode': decode_AST,
+        '_valid': valid_value,
+        '_single_array': single_array,
+        '_index': index_value,
+        '_apply': Compiler._apply_param_set,
+        '_ExpressionWrapper': Interpreter.ExpressionWrapper,
+        '_UserFunction': Function.UserFunction
+    }
+    namespace.update({name: Operators.BINARY[raw] for raw, name in Jit.BINARY_NAMES.items()})
+    namespace.update({name: Operators.UNARY[raw] for raw, name in Jit.UNARY_NAMES.items()})
+    return namespace
+
+def generate(programs, filename='<programs>'):
+    '''
+    Returns the line number, source, function name and code of each program. Running the code of a program defines
+    its function, which takes an interpreter and returns the value of the program.
+    programs:   A list of (line number, source) pairs
+    '''
+    generator = Generator()
+    compiled = []
+    for number, source in programs:
+        name, code = generator.add_program(source, filename)
+        compiled.append((number, source, name, code))
+    return tuple(compiled)
+
+def run_code(compiled):
+    '''
+    Runs the code of generated programs, returning the line number, source and function of each
+    '''
+    namespace = make_namespace()
+    programs = []
+    for number, source, name, code in compiled:
+        exec(code, namespace)
+        programs.append((number, source, namespace[name]))
+    return programs
+
+def get_cache_path(path):
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, '__pycache__', '{}.{}.calcc'.format(name, sys.implementation.cache_tag))
+
+def get_digest(source):
+    return hashlib.sha256('{}\n{}\n{}'.format(VERSION, sys.version, source).encode('utf-8')).digest()
+
+def read_cache(cache_path, digest):
+    '''
+    Returns the code cached for a source with the given hash, or None
+    '''
+    try:
+        with open(cache_path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    header = MAGIC + digest
+    if not data.startswith(header):
+        return None
+    try:
+        return marshal.loads(data[len(header):])
+    except (EOFError, ValueError, TypeError):
+        return None
+
+def write_cache(cache_path, digest, compiled):
+    '''
+    Writes generated programs to the cache, atomically so a concurrent run never reads part of it. Errors are ignored, since the
+    code can always be generated again.
+    '''
+    temp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(temp_path, 'wb') as f:
+            f.write(MAGIC + digest + marshal.dumps(compiled))
+        os.replace(temp_path, cache_path)
+    except OSError:
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+
+def load_programs(programs, path=None):
+    '''
+    Returns the line number, source and generated function of each program, using the code cached for the script at
+    the given path if its source has not changed, and caching the code otherwise
+    programs:   A list of (line number, source) pairs read from the script
+    '''
+    programs = list(programs)
+    digest = get_digest(repr(programs))
+    cache_path = get_cache_path(path) if path is not None else None
+    compiled = read_cache(cache_path, digest) if cache_path is not None else None
+    if compiled is None:
+        compiled = generate(programs, '<{}>'.format(path if path is not None else 'programs'))
+        if cache_path is not None:
+            write_cache(cache_path, digest, compiled)
+    return run_code(compiled)
+
+class Block():
+    '''
+    The lines of a generated function and the number of temporaries it uses
+    '''
+    def __init__(self, name, indent=1):
+        self.name = name
+        self.lines = []
+        self.indent = indent
+        self.temps = 0
+
+    def add(self, line):
+        self.lines.append('    ' * self.indent + line)
+
+    def temp(self):
+        self.temps += 1
+        return '_t{}'.format(self.temps)
+
+    def assign(self, value):
+        '''
+        Stores a value in a new temporary, returning its name
+        '''
+        temp = self.temp()
+        self.add('{} = {}'.format(temp, value))
+        return temp
+
+class Generator():
+    '''
+    Generates the functions of programs, and the constants holding the trees they need. The names it gives are
+    unique across programs, so their code can run in the same namespace.
+    '''
+    def __init__(self):
+        self.blocks = []
+        self.names = 0
+
+    def new_name(self, prefix):
+        self.names += 1
+        return '_{}{}'.format(prefix, self.names)
+
+    def constant_AST(self, AST):
+        name = self.new_name('ast')
+        self.blocks.append('{} = _decode({!r})'.format(name, encode_AST(AST)))
+        return name
+
+    def add_function(self, block, params='interpreter'):
+        self.blocks.append('def {}({}):\n{}\n'.format(block.name, params, '\n'.join(block.lines)))
+
+    def add_program(self, source, filename):
+        '''
+        Generates and compiles the function of a program, returning its name and the code defining it
+        '''
+        name = self.new_name('program')
+        self.blocks = []
+        try:
+            AST = Interpreter.Interpreter.parse(source)
+        except Exception:
+            # Evaluating the source again reports the error the parser gives
+            return name, self.evaluate_source(name, source, filename)
+
+        try:
+            block = Block(name)
+            if AST == ():
+                block.add('return None')
+            else:
+                value = self.node(AST, {'program': self.program, 'expression': self.expression}, block)
+                block.add('return {}'.format(value))
+            self.add_function(block)
+        except CodegenError:
+            self.blocks = []
+            try:
+                block = Block(name)
+                block.add('return interpreter.evaluate_AST({})'.format(self.constant_AST(AST)))
+                self.add_function(block)
+            except (ValueError, RecursionError):
+                return name, self.evaluate_source(name, source, filename)
+        except (ValueError, RecursionError):
+            # The tree is too deeply nested to generate, or to marshal for an argument
+            return name, self.evaluate_source(name, source, filename)
+
+        # Python's compiler has its own limits on nesting, beyond which the program is evaluated from its source
+        try:
+            return name, compile('\n'.join(self.blocks), filename, 'exec')
+        except (MemoryError, RecursionError, SyntaxError):
+            return name, self.evaluate_source(name, source, filename)
+
+    def evaluate_source(self, name, source, filename):
+        '''
+        Returns the code of a program function that has the interpreter evaluate the program's source
+        '''
+        block = Block(name)
+        block.add('return interpreter.evaluate({})'.format(literal(source)))
+        self.blocks = []
+        self.add_function(block)
+        return compile(self.blocks[0], filename, 'exec')
+
+    def node(self, tree, callback_dict, block):
+        if len(tree) < 2 or tree[0] not in callback_dict:
+            raise CodegenError('Cannot generate node \'{}\''.format(tree[0] if len(tree) > 0 else tree))
+        return callback_dict[tree[0]](block, *tree[1:])
+
+    def program(self, block, *lines):
+        result = 'None'
+        for line in lines:
+            result = self.node(line, {'line': self.line}, block)
+        return result
+
+    def line(self, block, rest):
+        if rest == ():
+            return 'None'
+        value = self.node(rest, {
+            'var_def': self.var_def,
+            'function_def': self.function_def,
+            'expression': self.expression
+        }, block)
+        if rest[0] == 'expression':
+            block.add('if type({}) == list:'.format(value))
+            block.add('    raise ValueError(\'A word list is not a valid line\')')
+        return value
+
+    def var_def(self, block, *args):
+        if len(args) == 1:
+            block.add('raise ValueError(\'No value given for variable definition\')')
+            return 'None'
+        value = self.node(args[-1], {'expression': self.valid_expression('A variable cannot be a{}')}, block)
+        for arg in args[:-1]:
+            block.add('interpreter._scope.set_value({}, {})'.format(literal(arg[0].value), value))
+        return value
+
+    def word_list(self, block, *args):
+        if len(args) == 1 and args[0] == ():
+            return '[]'
+        return '[{}]'.format(', '.join(literal(arg[0].value) for arg in args))
+
+    def function_def(self, block, word, word_list, definition):
+        # The definition stays a tree, which the function folds and compiles when it is called and which saves store
+        param_names = self.node(word_list, {'word_list': self.word_list}, block)
+        block.add('interpreter._scope.set_value({0}, _UserFunction({0}, {1}, {2}, interpreter._scope))'.format(
+            literal(word[0].value), param_names, self.constant_AST(definition)))
+        return 'None'
+
+    def expression(self, block, AST):
+        if AST == ():
+            return 'None'
+        return self.node(AST, {'infix': self.infix, 'word_list': self.word_list}, block)
+
+    def valid_expression(self, error_msg, allow_none=False):
+        def generate_valid_expression(block, AST):
+            value = self.expression(block, AST)
+            return block.assign('_valid({}, {}, {})'.format(value, literal(error_msg), allow_none))
+        return generate_valid_expression
+
+    def infix(self, block, *args):
+        if (len(args) - 1) % 2 != 0:
+            raise CodegenError('Invalid number of infix arguments')
+        operands = [self.node(arg, {'infix': self.infix, 'operand': self.operand}, block) for arg in args[0::2]]
+        names = [self.node(arg, {'operator': self.operator}, block) for arg in args[1::2]]
+        value = operands[0]
+        for name, operand in zip(names, operands[1:]):
+            value = '{}({}, {})'.format(name, value, operand)
+        return block.assign(value) if len(names) > 0 else value
+
+    def operator(self, block, operator):
+        name = Jit.BINARY_NAMES.get(operator[0].value)
+        if name is None:
+            raise CodegenError('Unknown operator')
+        return name
+
+    def unary_operator(self, block, operator):
+        name = Jit.UNARY_NAMES.get(operator[0].value)
+        if name is None:
+            raise CodegenError('Unknown unary operator')
+        return name
+
+    def operand(self, block, *args):
+        if len(args) > 1:
+            names = [self.node(arg, {'operator': self.unary_operator}, block) for arg in args[:-1]]
+            value = self.node(args[-1], {'operand': self.operand, 'implicit_mult': self.implicit_mult}, block)
+            for name in reversed(names):
+                value = '{}({})'.format(name, value)
+            return block.assign(value)
+        elif len(args[0]) == 1:
+            # If the only argument is a leaf, then it can only be a number
+            return literal(args[0][0].value)
+        return self.node(args[0], {
+            'implicit_mult': self.implicit_mult,
+            'index': self.index,
+            'function_call': self.function_call,
+            'array': self.array,
+            'name': self.name,
+            'expression': self.valid_expression('A{} cannot be an operand')
+        }, block)
+
+    def implicit_mult(self, block, *args):
+        operands = [self.node(arg, {'operand': self.operand}, block) for arg in args]
+        value = operands[0]
+        for operand in operands[1:]:
+            value = '{}({}, {})'.format(Jit.BINARY_NAMES['*'], value, operand)
+        return block.assign(value) if len(operands) > 1 else value
+
+    def name(self, block, *args):
+        name = '.'.join([arg[0].value for arg in args])
+        return block.assign('interpreter._scope.retrieve_value({})'.format(literal(name)))
+
+    def array(self, block, *args):
+        if len(args) == 1 and args[0] == ():
+            return block.assign('np.array([])')
+        elif len(args) == 1:
+            # Allow for empty arrays
+            value = self.node(args[0], {
+                'expression': self.valid_expression('A{} cannot be an array element', allow_none=True)
+            }, block)
+            return block.assign('_single_array({})'.format(value))
+        elements = [self.node(arg, {
+            'expression': self.valid_expression('A{} cannot be an array element')
+        }, block) for arg in args]
+        return block.assign('np.array([{}])'.format(', '.join(elements)))
+
+    def argument(self, AST):
+        '''
+        Generates the function of an argument, returning its name, or None if the interpreter should evaluate it
+        '''
+        block = Block(self.new_name('argument'))
+        try:
+            if AST == ():
+                value = 'None'
+            else:
+                value = self.node(AST, {'program': self.program, 'expression': self.expression}, block)
+        except CodegenError:
+            return None
+        block.add('return {}'.format(value))
+        self.add_function(block)
+        return block.name
+
+    def param_set(self, block, *args):
+        if len(args) == 1 and args[0] == ():
+            return block.assign('[]')
+        wrappers = ['_ExpressionWrapper({}, interpreter, {})'.format(self.constant_AST(arg), self.argument(arg)) for arg in args]
+        return block.assign('[{}]'.format(', '.join(wrappers)))
+
+    def function_call(self, block, callable, *args):
+        def empty_error(block, *args):
+            block.add('raise ValueError(\'An empty expression is not callable\')')
+            return 'None'
+        value = self.node(callable, {
+            'expression': self.valid_expression('A{} is not callable'),
+            'params': empty_error,
+            'name': self.name,
+            'index': self.index
+        }, block)
+        param_sets = [self.node(arg, {'params': self.param_set}, block) for arg in args]
+        for param_set in param_sets:
+            value = block.assign('_apply({}, {})'.format(value, param_set))
+        return value
+
+    def index(self, block, indexable, *args):
+        value = self.node(indexable, {
+            'expression': self.valid_expression('A{} is not indexable'),
+            'name': self.name,
+            'array': self.array
+        }, block)
+        indices = [self.node(arg, {'array': self.array}, block) for arg in args]
+        for index in indices:
+            value = block.assign('_index({}, {})'.format(value, index))
+        return value
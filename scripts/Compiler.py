@@ -0,0 +1,414 @@
+from functools import reduce
+import numpy as np
+import Interpreter
+import Function
+import Analysis
+import Scope
+import Operators
+
+class CompileError(Exception):
+    '''
+    Raised when an abstract syntax tree contains a node the compiler does not handle in its position.
+    The tree walking interpreter is used for such trees instead, so it can report the error itself if the node is ever evaluated.
+    '''
+    pass
+
+def compile_AST(AST):
+    '''
+    Compiles an abstract syntax tree into a closure that takes an interpreter and returns the same value as interpreter.evaluate_AST(AST).
+    Dispatch on node labels happens once here instead of on every evaluation.
+    Raises CompileError if the tree cannot be compiled.
+    '''
+    if AST == ():
+        return lambda interpreter: None
+    else:
+        return _compile_node(AST, {
+            'program': _compile_program,
+            'expression': _compile_expression
+        })
+
+def compile_function(AST, layout):
+    '''
+    Compiles the definition of a user function, whose frames store their names in slots given by the layout.
+    Names in the definition are resolved at compile time by a Resolver, and calls in tail position return a TailCall.
+    '''
+    global _resolver
+    previous = _resolver
+    _resolver = Resolver(layout, Analysis.get_binder_names(AST))
+    try:
+        tail_call = _get_tail_call(AST)
+        if tail_call is not None:
+            return _compile_tail_call(*tail_call[1:])
+        return compile_AST(AST)
+    finally:
+        _resolver = previous
+
+class Resolver():
+    '''
+    Resolves the names in a user function's definition. A parameter is read straight from its slot in the closest
+    frame of the function. Any other name is looked up from the scope the function was defined in, and the scope
+    owning it is cached until a name is added to or removed from one of the scopes searched.
+    Names that a builtin may bind in a scope of its own are left to the usual lookup, since such a scope can come
+    between the expression and the frame.
+    '''
+    def __init__(self, layout, binder_names):
+        self.layout = layout
+        self.binder_names = binder_names
+
+    def compile_name(self, name):
+        if name in self.binder_names:
+            return None
+        slot = self.layout.get(name)
+        if slot is not None:
+            return self._compile_slot(name, slot)
+        else:
+            return self._compile_free_name(name)
+
+    def _compile_slot(self, name, slot):
+        layout = self.layout
+        def evaluate_slot(interpreter):
+            scope = interpreter._scope
+            while scope is not None and scope._layout is not layout:
+                scope = scope._parent
+            if scope is None:
+                return interpreter._scope.retrieve_value(name)
+            return scope._slots[slot]
+        return evaluate_slot
+
+    def _compile_free_name(self, name):
+        layout = self.layout
+        # The version, starting scope and owner of the last lookup
+        cache = [None, None, None]
+        def evaluate_free_name(interpreter):
+            frame = interpreter._scope
+            while frame is not None and frame._layout is not layout:
+                frame = frame._parent
+            if frame is None or frame._symbol_table:
+                return interpreter._scope.retrieve_value(name)
+            start = frame._parent
+            if cache[0] != Scope.Scope._version or cache[1] is not start:
+                owner = start.find_owner(name) if start is not None else None
+                if owner is None:
+                    return interpreter._scope.retrieve_value(name)
+                cache[0] = Scope.Scope._version
+                cache[1] = start
+                cache[2] = owner
+            return cache[2].retrieve_value(name)
+        return evaluate_free_name
+
+# The resolver of the user function whose definition is being compiled, if any
+_resolver = None
+
+def _compile_node(tree, callback_dict):
+    if len(tree) < 2 or tree[0] not in callback_dict:
+        raise CompileError('Cannot compile node \'{}\''.format(tree[0] if len(tree) > 0 else tree))
+    else:
+        return callback_dict[tree[0]](*tree[1:])
+
+def _raise_value_error(msg):
+    def raise_error(interpreter):
+        raise ValueError(msg)
+    return raise_error
+
+def _compile_program(*lines):
+    compiled_lines = [_compile_node(line, {'line': _compile_line}) for line in lines]
+    def evaluate_program(interpreter):
+        result = None
+        for compiled_line in compiled_lines:
+            result = compiled_line(interpreter)
+        return result
+    return evaluate_program
+
+def _compile_line(rest):
+    if rest == ():
+        return lambda interpreter: None
+    compiled = _compile_node(rest, {
+        'var_def': _compile_var_def,
+        'function_def': _compile_function_def,
+        'expression': _compile_expression
+    })
+    def evaluate_line(interpreter):
+        value = compiled(interpreter)
+        if type(value) == list:
+            raise ValueError('A word list is not a valid line')
+        return value
+    return evaluate_line
+
+def _compile_var_def(*args):
+    if len(args) == 1:
+        return _raise_value_error('No value given for variable definition')
+    compiled = _compile_node(args[-1], {
+        'expression': _compile_valid_expression('A variable cannot be a{}')
+    })
+    names = [arg[0].value for arg in args[:-1]]
+    def evaluate_var_def(interpreter):
+        value = compiled(interpreter)
+        for name in names:
+            interpreter._scope.set_value(name, value)
+        return value
+    return evaluate_var_def
+
+def _compile_word_list(*args):
+    if len(args) == 1 and args[0] == ():
+        words = []
+    else:
+        words = [arg[0].value for arg in args]
+    return lambda interpreter: list(words)
+
+def _compile_function_def(word, word_list, definition):
+    function_name = word[0].value
+    param_names = _compile_node(word_list, {'word_list': _compile_word_list})(None)
+    def evaluate_function_def(interpreter):
+        user_function = Function.UserFunction(function_name, list(param_names), definition, interpreter._scope)
+        interpreter._scope.set_value(function_name, user_function)
+        return None
+    return evaluate_function_def
+
+def _compile_expression(AST):
+    if AST == ():
+        return lambda interpreter: None
+    else:
+        return _compile_node(AST, {
+            'infix': _compile_infix,
+            'word_list': _compile_word_list
+        })
+
+def _compile_valid_expression(error_msg, allow_none=False):
+    def compile_valid_expression(AST):
+        compiled = _compile_expression(AST)
+        def evaluate_valid_expression(interpreter):
+            value = compiled(interpreter)
+            if type(value) == list:
+                raise ValueError(error_msg.format(' word list'))
+            elif value is None and not allow_none:
+                raise ValueError(error_msg.format('n empty expression'))
+            else:
+                return value
+        return evaluate_valid_expression
+    return compile_valid_expression
+
+def _compile_infix(*args):
+    if (len(args) - 1) % 2 != 0:
+        return _raise_value_error('Invalid number of infix arguments... good job Chris this shouldn\'t be possible at all')
+
+    # Operands and operators must alternate, otherwise let the interpreter deal with the tree
+    operands = [_compile_node(arg, {
+        'infix': _compile_infix,
+        'operand': _compile_operand
+    }) for arg in args[0::2]]
+    funcs = [_compile_node(arg, {
+        'operator': _compile_operator
+    }) for arg in args[1::2]]
+
+    if len(operands) == 1:
+        return operands[0]
+
+    first = operands[0]
+    if len(operands) == 2:
+        func, second = funcs[0], operands[1]
+        def evaluate_binary(interpreter):
+            value = first(interpreter)
+            return func(value, second(interpreter))
+        return evaluate_binary
+
+    steps = list(zip(funcs, operands[1:]))
+    def evaluate_infix(interpreter):
+        value = first(interpreter)
+        values = [operand(interpreter) for _, operand in steps]
+        for (func, _), value2 in zip(steps, values):
+            value = func(value, value2)
+        return value
+    return evaluate_infix
+
+def _compile_operator(operator):
+    func = Operators.BINARY.get(operator[0].value)
+    if func is None:
+        raise CompileError('Unknown operator')
+    return func
+
+def _compile_unary_operator(operator):
+    func = Operators.UNARY.get(operator[0].value)
+    if func is None:
+        raise CompileError('Unknown unary operator')
+    return func
+
+def _compile_operand(*args):
+    if len(args) > 1:
+        ops = [_compile_node(arg, {
+            'operator': _compile_unary_operator
+        }) for arg in args[:-1]]
+        compiled = _compile_node(args[-1], {
+            'operand': _compile_operand,
+            'implicit_mult': _compile_implicit_mult
+        })
+        ops.reverse()
+        def evaluate_unary_operand(interpreter):
+            value = compiled(interpreter)
+            for op in ops:
+                value = op(value)
+            return value
+        return evaluate_unary_operand
+    else:
+        # If the only argument is a leaf, then it can only be a number, so return its value
+        if len(args[0]) == 1:
+            value = args[0][0].value
+            return lambda interpreter: value
+        else:
+            return _compile_node(args[0], {
+                'implicit_mult': _compile_implicit_mult,
+                'index': _compile_index,
+                'function_call': _compile_function_call,
+                'array': _compile_array,
+                'name': _compile_name,
+                'expression': _compile_valid_expression('A{} cannot be an operand'),
+            })
+
+def _compile_implicit_mult(*args):
+    operands = [_compile_node(arg, {
+        'operand': _compile_operand
+    }) for arg in args]
+    def evaluate_implicit_mult(interpreter):
+        values = [operand(interpreter) for operand in operands]
+        return reduce(Operators.multiply, values[1:], values[0])
+    return evaluate_implicit_mult
+
+def _compile_name(*args):
+    name = '.'.join([arg[0].value for arg in args])
+    if _resolver is not None:
+        compiled = _resolver.compile_name(name)
+        if compiled is not None:
+            return compiled
+    def evaluate_name(interpreter):
+        return interpreter._scope.retrieve_value(name)
+    return evaluate_name
+
+def _compile_array(*args):
+    if len(args) == 1 and args[0] == ():
+        return lambda interpreter: np.array([])
+    elif len(args) == 1:
+        # Allow for empty arrays
+        compiled = _compile_node(args[0], {
+            'expression': _compile_valid_expression('A{} cannot be an array element', allow_none=True)
+        })
+        def evaluate_single_array(interpreter):
+            value = compiled(interpreter)
+            if value == None:
+                return np.array([])
+            return np.array([value])
+        return evaluate_single_array
+    else:
+        elements = [_compile_node(arg, {
+            'expression': _compile_valid_expression('A{} cannot be an array element')
+        }) for arg in args]
+        def evaluate_array(interpreter):
+            return np.array([element(interpreter) for element in elements])
+        return evaluate_array
+
+def _compile_param_set(*args):
+    if len(args) == 1 and args[0] == ():
+        return lambda interpreter: []
+    else:
+        params = [(arg, compile_AST(arg)) for arg in args]
+        def evaluate_param_set(interpreter):
+            return [Interpreter.ExpressionWrapper(arg, interpreter, compiled) for arg, compiled in params]
+        return evaluate_param_set
+
+def _compile_callable(callable):
+    return _compile_node(callable, {
+        'expression': _compile_valid_expression('A{} is not callable'),
+        'params': lambda *x: _raise_value_error('An empty expression is not callable'),
+        'name': _compile_name,
+        'index': _compile_index
+    })
+
+def _apply_param_set(value, param_set):
+    if isinstance(value, Function.Function):
+        return value.evaluate(param_set)
+    else:
+        if len(param_set) != 1:
+            raise ValueError('\'{}\' is not callable'.format(type(value)))
+        else:
+            return np.multiply(value, param_set[0].eval('Cannot multiply by a{}'))
+
+def _compile_function_call(callable, *args):
+    compiled_callable = _compile_callable(callable)
+    param_sets = [_compile_node(arg, {
+        'params': _compile_param_set
+    }) for arg in args]
+    def evaluate_function_call(interpreter):
+        value = compiled_callable(interpreter)
+        for param_set in [param_set(interpreter) for param_set in param_sets]:
+            value = _apply_param_set(value, param_set)
+        return value
+    return evaluate_function_call
+
+def _get_tail_call(AST):
+    '''
+    Returns the function call node an expression consists of, or None if it is any other expression.
+    Such an expression evaluates to the value of the call unchanged.
+    '''
+    if len(AST) != 2 or AST[0] != 'expression' or AST[1] == ():
+        return None
+    node = AST[1]
+    if node[0] != 'infix' or len(node) != 2:
+        return None
+    node = node[1]
+    if node[0] != 'operand' or len(node) != 2:
+        return None
+    node = node[1]
+    if len(node) < 2 or node[0] != 'function_call':
+        return None
+    return node
+
+def _compile_tail_call(callable, *args):
+    '''
+    Compiles a function call in tail position. A call of a user function by the last parameter set returns a TailCall
+    instead of making the call. If a builtin with tail parameters is called instead, calls in those arguments are
+    compiled in tail position too.
+    '''
+    compiled_callable = _compile_callable(callable)
+    param_sets = [_compile_node(arg, {
+        'params': _compile_param_set
+    }) for arg in args]
+    tail_args = []
+    for arg in args[-1][1:]:
+        tail_call = _get_tail_call(arg) if arg != () else None
+        tail_args.append(_compile_tail_call(*tail_call[1:]) if tail_call is not None else None)
+    def evaluate_tail_call(interpreter):
+        value = compiled_callable(interpreter)
+        evaluated_param_sets = [param_set(interpreter) for param_set in param_sets]
+        for param_set in evaluated_param_sets[:-1]:
+            value = _apply_param_set(value, param_set)
+        param_set = evaluated_param_sets[-1]
+        if isinstance(value, Function.UserFunction):
+            value.check_arguments(len(param_set))
+            return Function.TailCall(value, [param.eval('Cannot bind a{} to a function parameter') for param in param_set])
+        elif isinstance(value, Function.BuiltinFunction) and value.get_tail_params():
+            param_set = list(param_set)
+            for i in value.get_tail_params():
+                if i < len(param_set) and i < len(tail_args) and tail_args[i] is not None:
+                    param_set[i] = Interpreter.TailExpressionWrapper(param_set[i].get_AST(), interpreter, tail_args[i])
+            return value.evaluate(param_set)
+        else:
+            return _apply_param_set(value, param_set)
+    return evaluate_tail_call
+
+def _compile_index(indexable, *args):
+    compiled_indexable = _compile_node(indexable, {
+        'expression': _compile_valid_expression('A{} is not indexable'),
+        'name': _compile_name,
+        'array': _compile_array
+    })
+    indices = [_compile_node(arg, {
+        'array': _compile_array
+    }) for arg in args]
+    def evaluate_index(interpreter):
+        value = compiled_indexable(interpreter)
+        for index in [index(interpreter) for index in indices]:
+            if type(value) == np.ndarray:
+                int_array = Interpreter.Interpreter.to_ints(index, 'An array can only be indexed with integers')
+                value = value[tuple(int_array)]
+            else:
+                value = np.multiply(value, index)
+        return value
+    return evaluate_index
@@ -1,6 +1,11 @@
 from abc import ABC, abstractmethod
 import Scope
 import Interpreter
+import Compiler
+import Analysis
+import Memo
+import Optimizer
+import Jit
 
 class Function(ABC):
     def __init__(self, name, param_names):
@@ -24,14 +29,68 @@ class Function(ABC):
     def add_to(self, scope, mutable=True):
         scope.set_value(self._name, self, mutable=mutable)
 
+    def get_name(self):
+        return self._name
+
+    def get_param_names(self):
+        return self._param_names
+
+    def check_arguments(self, count):
+        if count != len(self._param_names):
+            raise ValueError('{} expected {} arguments but received {}'.format(self._name, len(self._param_names), count))
+
+    def call_each(self, rows, scope):
+        '''
+        Evaluates the function once for each list of already evaluated arguments, yielding the results.
+        Arguments:
+            rows:                   An iterable of lists of values to bind to the function's parameters
+            scope:                  The scope the values were evaluated in
+        '''
+        for values in rows:
+            yield self.evaluate([Interpreter.ValueWrapper(value, scope) for value in values])
+
+class TailCall():
+    '''
+    Returned by a compiled definition in place of calling a user function in tail position, so that the caller can
+    release its frame before making the call. err_msg is set if the call was the value of an argument, which must
+    not be empty or a word list.
+    '''
+    __slots__ = ('function', 'values', 'err_msg')
+
+    def __init__(self, function, values, err_msg=None):
+        self.function = function
+        self.values = values
+        self.err_msg = err_msg
+
 class UserFunction(Function):
     '''
     In a user function, the definition is an abstract syntax tree given by the parser
     '''
+    # Number of released call frames each function keeps for reuse
+    max_pooled_frames = 256
+
+    # Number of results memoized by each pure function. Memoization is disabled if this is 0.
+    memo_size = 1024
+
+    # Whether numeric definitions are lowered to Python functions by Jit when called with floats
+    jit = False
+
     def __init__(self, name, param_names, definition, parent_scope):
         super().__init__(name, param_names)
         self._definition = definition
         self._parent_scope = parent_scope
+        self._compiled = None
+        self._layout = None
+        self._frame_pool = []
+        self._memo = None
+        self._memo_generation = None
+        self._memo_dependencies = None
+        self._optimized = None
+        self._optimized_dependencies = None
+        self._optimized_generation = None
+        self._jitted = None
+        self._jitted_dependencies = None
+        self._jitted_generation = None
     
     def __repr__(self):
         num_params = len(self._param_names)
@@ -40,17 +99,181 @@ class UserFunction(Function):
         else:
             return ('UserFunction: {}(' + ('{}' * num_params) + ')').format(self._name, *self._param_names)
 
+    def get_definition(self):
+        return self._definition
+
+    def get_parent_scope(self):
+        return self._parent_scope
+
     def evaluate(self, params):
         if len(params) != len(self._param_names):
             raise ValueError('{} expected {} arguments but received {}'.format(self._name, len(self._param_names), len(params)))
         else:
-            scope = Scope.Scope(parent=self._parent_scope)
-            scope.set_value('self', self, mutable=False)
             values = [param.eval('Cannot bind a{} to a function parameter') for param in params]
-            for name, value in zip(self._param_names, values):
-                scope.set_value(name, value, mutable=False)
-            interpreter = Interpreter.Interpreter(scope)
-            return interpreter.evaluate_AST(self._definition)
+            return self.evaluate_values(values)
+
+    def evaluate_values(self, values):
+        '''
+        Returns the value of the function for already evaluated arguments, through its memo if it has one
+        '''
+        if UserFunction.memo_size > 0:
+            memo = self.get_memo()
+            key = Memo.make_key(values) if memo is not None else None
+            if key is not None:
+                entry = memo.get(key)
+                if entry is not None:
+                    return entry[0]
+                result = UserFunction.follow_tail_calls(self._call_once(values))
+                memo.put(key, result)
+                return result
+        return UserFunction.follow_tail_calls(self._call_once(values))
+
+    def get_memo(self):
+        '''
+        Returns the memo of the function's results, or None if the function is not pure.
+        Purity is checked again after any watched scope changed, and the memo is cleared if a dependency was replaced.
+        '''
+        if self._memo_generation != Scope.Scope._generation:
+            dependencies = Analysis.get_dependencies(self)
+            if dependencies is None:
+                self._memo = None
+            elif self._memo is None:
+                self._memo = Memo.Memo(UserFunction.memo_size)
+            elif not Memo.same_dependencies(dependencies, self._memo_dependencies):
+                self._memo.clear()
+            self._memo_dependencies = dependencies
+            self._memo_generation = Scope.Scope._generation
+        return self._memo
+
+    def _call_once(self, values):
+        '''
+        Evaluates the definition with the given argument values, which may return a TailCall
+        '''
+        if UserFunction.jit:
+            result = self._call_jitted(values)
+            if result is not None:
+                return result
+        frame = self._acquire_frame()
+        try:
+            frame.bind(values)
+            return self._run(frame.interpreter)
+        finally:
+            self._release_frame(frame)
+
+    def follow_tail_calls(result):
+        '''
+        Makes the calls returned from tail positions one after the other, so recursion through them uses no stack.
+        The final result is checked the way the expressions that returned the tail calls would have checked it.
+        '''
+        err_msg = None
+        while type(result) is TailCall:
+            if result.err_msg is not None:
+                err_msg = result.err_msg
+            result = result.function._call_once(result.values)
+        if err_msg is not None:
+            if type(result) == list:
+                raise ValueError(err_msg.format(' word list'))
+            elif result is None:
+                raise ValueError(err_msg.format('n empty expression'))
+        return result
+
+    def call_each(self, rows, scope):
+        '''
+        Evaluates the function once for each list of already evaluated arguments, yielding the results.
+        A single frame is rebound for every call, unless a lambda created during a call has captured it.
+        '''
+        frame = self._acquire_frame()
+        try:
+            for values in rows:
+                if len(values) != len(self._param_names):
+                    raise ValueError('{} expected {} arguments but received {}'.format(self._name, len(self._param_names), len(values)))
+                if UserFunction.jit:
+                    result = self._call_jitted(values)
+                    if result is not None:
+                        yield result
+                        continue
+                if frame.is_captured():
+                    frame = self._acquire_frame()
+                frame.bind(values)
+                yield UserFunction.follow_tail_calls(self._run(frame.interpreter))
+        finally:
+            self._release_frame(frame)
+
+    def _acquire_frame(self):
+        if self._frame_pool:
+            frame = self._frame_pool.pop()
+            frame.reset(self._parent_scope)
+            return frame
+        if self._layout is None:
+            self._layout = Scope.Frame.make_layout(self._param_names)
+        return Scope.Frame(self, self._layout)
+
+    def _release_frame(self, frame):
+        # A captured frame is still referenced by a lambda, so it must not be rebound
+        if not frame.is_captured() and len(self._frame_pool) < UserFunction.max_pooled_frames:
+            self._frame_pool.append(frame)
+
+    def _run(self, interpreter):
+        compiled = self.get_compiled()
+        if compiled:
+            return compiled(interpreter)
+        else:
+            return interpreter.evaluate_AST(self.get_optimized())
+
+    def get_optimized(self):
+        '''
+        Returns the definition with its constant subexpressions folded. The definition is folded again, and compiled
+        again, if a name the folding relied on has been redefined since.
+        '''
+        if not Interpreter.Interpreter.optimize:
+            return self._definition
+        if self._optimized_generation != Scope.Scope._generation:
+            if self._optimized is None or not Optimizer.still_valid(self._optimized_dependencies, self._parent_scope):
+                bound = ['self'] + self._param_names
+                self._optimized, self._optimized_dependencies = Optimizer.optimize(self._definition, self._parent_scope, bound)
+                self._compiled = None
+                self._jitted = None
+            self._optimized_generation = Scope.Scope._generation
+        return self._optimized
+
+    def get_compiled(self):
+        '''
+        Returns the definition compiled into a closure, compiling it on first use.
+        Returns False if the definition could not be compiled, in which case it is interpreted instead.
+        '''
+        definition = self.get_optimized()
+        if self._compiled is None:
+            if self._layout is None:
+                self._layout = Scope.Frame.make_layout(self._param_names)
+            try:
+                self._compiled = Compiler.compile_function(definition, self._layout)
+            except Compiler.CompileError:
+                self._compiled = False
+        return self._compiled
+
+    def get_jitted(self):
+        '''
+        Returns the definition lowered by Jit, lowering it on first use and again once a name it relied on is redefined.
+        Returns False if the definition cannot be lowered, in which case it is interpreted instead.
+        '''
+        definition = self.get_optimized()
+        if self._jitted_generation != Scope.Scope._generation:
+            if self._jitted is not None and not Jit.still_valid(self._jitted_dependencies):
+                self._jitted = None
+            self._jitted_generation = Scope.Scope._generation
+        if self._jitted is None:
+            dependencies = self._optimized_dependencies if Interpreter.Interpreter.optimize else {}
+            self._jitted, self._jitted_dependencies = Jit.jit_function(self, definition, dependencies)
+        return self._jitted
+
+    def _call_jitted(self, values):
+        '''
+        Returns the value of the lowered definition for the given values, or None if it cannot be used for them
+        '''
+        jitted = self.get_jitted()
+        if not jitted:
+            return None
+        return jitted.call(values)
 
     def serialize(self, path, serialized):
         if self not in serialized:
@@ -114,9 +337,30 @@ def deserialize_AST(AST):
             return AST
 
 class BuiltinFunction(Function):
-    def __init__(self, name, param_names, func):
+    '''
+    A builtin function is elementwise if it applies a NumPy ufunc to its evaluated arguments, so that calling it on
+    arrays gives the same values as calling it on each element.
+    Calls in its tail parameters are in tail position when the builtin itself is.
+    A builtin is pure if its value depends only on its arguments and calling it changes nothing.
+    '''
+    def __init__(self, name, param_names, func, elementwise=False, tail_params=(), pure=True):
         super().__init__(name, param_names)
         self._func = func
+        self._elementwise = elementwise
+        self._tail_params = tail_params
+        self._pure = pure
+
+    def is_pure(self):
+        return self._pure
+
+    def is_elementwise(self):
+        return self._elementwise
+
+    def get_tail_params(self):
+        '''
+        Returns the indices of the parameters whose value the builtin may return as is after evaluating them once
+        '''
+        return self._tail_params
     
     def __repr__(self):
         num_params = len(self._param_names)
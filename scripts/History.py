@@ -0,0 +1,56 @@
+'''
+Growable store of the answers of a session, exposed to programs as the ans array.
+'''
+import numpy as np
+
+class History():
+    '''
+    Answers are kept in an object array with spare capacity, which doubles when it runs out, so appending is
+    amortized constant time. values() is a view of the filled part, which is what ans is bound to.
+    Full buffers are replaced rather than modified, so views handed out earlier never change.
+    If maxlen is given, only the most recent maxlen answers are kept.
+    '''
+    def __init__(self, initial=(), capacity=16, maxlen=None):
+        if maxlen is not None and maxlen < 1:
+            raise ValueError('History length must be at least 1')
+        self._maxlen = maxlen
+        self._length = 0
+        self._buffer = np.empty(max(capacity, 1), dtype=object)
+        for value in initial:
+            self.append(value)
+
+    def __getitem__(self, index):
+        return self.values()[index]
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.values()
+        return values if dtype is None else values.astype(dtype)
+
+    def __len__(self):
+        return self._length - self._start()
+
+    def _start(self):
+        if self._maxlen is None:
+            return 0
+        return max(0, self._length - self._maxlen)
+
+    def values(self):
+        return self._buffer[self._start():self._length]
+
+    def append(self, value):
+        if self._length == len(self._buffer):
+            self._grow()
+        self._buffer[self._length] = value
+        self._length += 1
+
+    def _grow(self):
+        keep = self._length
+        capacity = 2 * len(self._buffer)
+        if self._maxlen is not None:
+            # Drop the answers that are no longer visible, leaving room for maxlen more before the next copy
+            keep = min(keep, self._maxlen)
+            capacity = min(capacity, 2 * self._maxlen)
+        buffer = np.empty(capacity, dtype=object)
+        buffer[:keep] = self._buffer[self._length - keep:self._length]
+        self._buffer = buffer
+        self._length = keep
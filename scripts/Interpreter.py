@@ -1,20 +1,45 @@
 from Parsers import program
+import PrecedenceParser
+from collections import OrderedDict
+import re
+import sys
+import threading
 import numpy as np
 import Scope
 import Function
+import Compiler
+import Optimizer
+import Operators
 from Lexer import Token, tokenize
 from functools import reduce
 
 class ExpressionWrapper():
-    def __init__(self, expression, interpreter):
+    def __init__(self, expression, interpreter, compiled=None):
         self._expression = expression
         self._interpreter = interpreter
+        self._compiled = compiled
     
     def get_AST(self):
         return self._expression
 
+    def with_interpreter(self, interpreter):
+        '''
+        Returns a wrapper of the same expression that is evaluated by the given interpreter.
+        The expression is compiled if it was not already, since callers use this to evaluate it repeatedly.
+        '''
+        compiled = self._compiled
+        if compiled is None:
+            try:
+                compiled = Compiler.compile_AST(self._expression)
+            except Compiler.CompileError:
+                compiled = None
+        return ExpressionWrapper(self._expression, interpreter, compiled)
+
     def eval(self, err_msg='Did not expect a{}'):
-        value = self._interpreter.evaluate_AST(self._expression)
+        if self._compiled is not None:
+            value = self._compiled(self._interpreter)
+        else:
+            value = self._interpreter.evaluate_AST(self._expression)
         if type(value) == list:
             raise ValueError(err_msg.format(' word list'))
         elif value is None:
@@ -28,12 +53,147 @@ class ExpressionWrapper():
     def get_scope(self):
         return self._interpreter._scope
 
+class TailExpressionWrapper(ExpressionWrapper):
+    '''
+    Wraps an argument in tail position, whose compiled closure may return a TailCall. Since the value of the call is
+    not known yet, the tail call carries the error message to check it with instead.
+    '''
+    def eval(self, err_msg='Did not expect a{}'):
+        value = self._compiled(self._interpreter)
+        if type(value) is Function.TailCall:
+            if value.err_msg is None:
+                value.err_msg = err_msg
+            return value
+        elif type(value) == list:
+            raise ValueError(err_msg.format(' word list'))
+        elif value is None:
+            raise ValueError(err_msg.format('n empty expression'))
+        else:
+            return value
+
+class ValueWrapper():
+    '''
+    Wraps an already evaluated value so that it can be passed to a builtin function in place of an expression
+    '''
+    def __init__(self, value, scope):
+        self._value = value
+        self._scope = scope
+
+    def get_AST(self):
+        return None
+
+    def with_interpreter(self, interpreter):
+        return self
+
+    def eval(self, err_msg='Did not expect a{}'):
+        return self._value
+
+    def to_word_list(self):
+        return None
+
+    def get_scope(self):
+        return self._scope
+
+class ParseCache():
+    '''
+    Bounded least recently used cache mapping source text to its abstract syntax tree.
+    Runs of whitespace are collapsed before lookup, since the lexer treats them all the same.
+    '''
+    whitespace_pattern = re.compile(r'\s+')
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._table = OrderedDict()
+
+    def __len__(self):
+        return len(self._table)
+
+    def normalize(string):
+        return ParseCache.whitespace_pattern.sub(' ', string).lstrip()
+
+    def get(self, string):
+        '''
+        Returns the cached tree for the given source, or None if it has not been parsed yet
+        '''
+        key = ParseCache.normalize(string)
+        AST = self._table.get(key)
+        if AST is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._table.move_to_end(key)
+        return AST
+
+    def put(self, string, AST):
+        if self.maxsize <= 0:
+            return
+        key = ParseCache.normalize(string)
+        self._table[key] = AST
+        self._table.move_to_end(key)
+        while len(self._table) > self.maxsize:
+            self._table.popitem(last=False)
+
+    def clear(self):
+        self._table.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._table), 'maxsize': self.maxsize}
+
 class Interpreter():
+    # Parsed programs are shared by every interpreter, since trees are never modified
+    parse_cache = ParseCache()
+    parser_backends = ['precedence', 'combinator']
+    parser_backend = 'precedence'
+
+    # Whether constant subexpressions are folded before evaluation (see Optimizer)
+    optimize = True
+
+    # Folded programs by the identity of their parsed tree, along with the names the folding relied on
+    folded_cache = OrderedDict()
+
+    # Stack size and recursion limit of the thread used by evaluate_deep
+    deep_stack_size = 512 * 1024 * 1024
+    deep_recursion_limit = 5000000
+
     def __init__(self, scope):
         self._scope = scope
 
     def evaluate(self, string):
-        return self.evaluate_AST(self._get_AST(string))
+        return self.evaluate_AST(self._optimize(self._get_AST(string)))
+
+    def evaluate_deep(self, string):
+        '''
+        Evaluates a program on a thread with a large stack and recursion limit, so that recursion which is not in
+        tail position is limited by memory rather than by the default stack.
+        '''
+        return Interpreter.run_deep(self.evaluate, string)
+
+    def run_deep(func, *args):
+        result = []
+        error = []
+        def target():
+            try:
+                result.append(func(*args))
+            except BaseException as err:
+                error.append(err)
+
+        previous_limit = sys.getrecursionlimit()
+        previous_size = threading.stack_size(Interpreter.deep_stack_size)
+        try:
+            sys.setrecursionlimit(max(previous_limit, Interpreter.deep_recursion_limit))
+            thread = threading.Thread(target=target)
+            thread.start()
+            thread.join()
+        finally:
+            threading.stack_size(previous_size)
+            sys.setrecursionlimit(previous_limit)
+        if error:
+            raise error[0]
+        return result[0]
 
     def evaluate_AST(self, AST):
         if AST == ():
@@ -74,20 +234,67 @@ class Interpreter():
         return self._scope.get_root_scope()
 
     def _get_AST(self, string):
+        AST = Interpreter.parse_cache.get(string)
+        if AST is None:
+            AST = Interpreter.parse(string)
+            Interpreter.parse_cache.put(string, AST)
+        return AST
+
+    def _optimize(self, AST):
+        '''
+        Returns the program with its constant subexpressions folded, reusing the folding of an earlier evaluation of
+        the same tree while the names it relied on still refer to the same values
+        '''
+        if not Interpreter.optimize or AST == ():
+            return AST
+        cache = Interpreter.folded_cache
+        entry = cache.get(id(AST))
+        if entry is not None and entry[0] is AST and Optimizer.still_valid(entry[2], self._scope):
+            cache.move_to_end(id(AST))
+            return entry[1]
+        folded, dependencies = Optimizer.optimize(AST, self._scope)
+        if Interpreter.parse_cache.maxsize > 0:
+            # The tree is kept in the entry so that its id is not reused while the entry exists
+            cache[id(AST)] = (AST, folded, dependencies)
+            cache.move_to_end(id(AST))
+            while len(cache) > Interpreter.parse_cache.maxsize:
+                cache.popitem(last=False)
+        return folded
+
+    def parse(string):
+        '''
+        Tokenizes and parses the given source with the selected parser backend, bypassing the parse cache
+        '''
         tokens = tokenize(string)
-        pos_set, tree_dict = program(tokens, 0)
-        if len(tokens) not in pos_set:
-            if len(pos_set) == 0:
-                raise ValueError('Syntax error')
+        if Interpreter.parser_backend == 'combinator':
+            pos_set, tree_dict = program(tokens, 0)
+            if len(tokens) not in pos_set:
+                if len(pos_set) == 0:
+                    raise ValueError('Syntax error')
+                else:
+                    error_pos = max(pos_set)
+                    raise ValueError('Unexpected token \'{}\''.format(tokens[error_pos]))
             else:
-                error_pos = max(pos_set)
-                raise ValueError('Unexpected token \'{}\''.format(tokens[error_pos]))
+                tree = tree_dict[len(tokens)]
+                if tree == ():
+                    return tree
+                else:
+                    return tree[0]
         else:
-            tree = tree_dict[len(tokens)]
-            if tree == ():
-                return tree
-            else:
-                return tree[0]
+            error_pos, tree = PrecedenceParser.parse(tokens)
+            if error_pos != len(tokens):
+                raise ValueError('Unexpected token \'{}\''.format(tokens[error_pos]))
+            return tree
+
+    def set_parser_backend(backend):
+        '''
+        Selects the parser used by every interpreter, either 'precedence' or 'combinator'.
+        Both produce the same trees; the combinator parser is kept so the two can be cross-checked.
+        '''
+        if backend not in Interpreter.parser_backends:
+            raise ValueError('Unknown parser backend \'{}\''.format(backend))
+        Interpreter.parser_backend = backend
+        Interpreter.parse_cache.clear()
 
     def _evaluate_node(self, tree, leaf_callback, callback_dict):
         if len(tree) < 2:
@@ -185,54 +392,22 @@ class Interpreter():
         }) for arg in args]
         if (len(values) - 1) % 2 != 0:
             raise ValueError('Invalid number of infix arguments... good job Chris this shouldn\'t be possible at all')
-        while len(values) > 1:
-            value1, func, value2 = values[:3]
-            values = [func(value1, value2)] + values[3:]
-        return values[0]
+        value = values[0]
+        for i in range(1, len(values), 2):
+            value = values[i](value, values[i + 1])
+        return value
 
     def _evaluate_operator(self, operator):
-        raw = operator[0].value
-        if raw == '^':
-            return np.power
-        elif raw == '*':
-            return np.multiply
-        elif raw == '/':
-            return np.divide
-        elif raw == '%':
-            return np.mod
-        elif raw == '+':
-            return np.add
-        elif raw == '-':
-            return np.subtract
-        elif raw == '>':
-            return np.greater
-        elif raw == '<':
-            return np.less
-        elif raw == '>=':
-            return np.greater_equal
-        elif raw == '<=':
-            return np.less_equal
-        elif raw == '==' or raw == 'eq':
-            return np.equal
-        elif raw == '!=' or raw == 'neq':
-            return np.not_equal
-        elif raw == 'and':
-            return np.logical_and
-        elif raw == 'or':
-            return np.logical_or
-        else:
+        func = Operators.BINARY.get(operator[0].value)
+        if func is None:
             raise ValueError('Unknown operator')
+        return func
 
     def _evaluate_unary_operator(self, operator):
-        raw = operator[0].value
-        if raw == '+':
-            return np.positive
-        elif raw == '-':
-            return np.negative
-        elif raw == '!' or raw == 'not':
-            return np.logical_not
-        else:
+        func = Operators.UNARY.get(operator[0].value)
+        if func is None:
             raise ValueError('Unknown unary operator')
+        return func
 
     def _evaluate_operand(self, *args):
         if len(args) > 1:
@@ -266,7 +441,7 @@ class Interpreter():
                 'operand': self._evaluate_operand
             }) for arg in args
         ]
-        return reduce(np.multiply, values[1:], values[0])
+        return reduce(Operators.multiply, values[1:], values[0])
 
     def _evaluate_name(self, *args):
         name = self._retrieve_name(*args)
@@ -361,7 +536,12 @@ class Interpreter():
     def get_global_interpreter(interface=False, subscope=None):
         return Interpreter(Scope.Scope.get_global_scope(interface=interface, subscope=subscope))
 
-    def deserialize(obj):
+    def deserialize(obj, lazy=False):
+        '''
+        Rebuilds a serialized scope. If lazy, names are only deserialized when they are first used.
+        '''
+        if lazy:
+            return Scope.Scope.deserialize(obj, '.', Scope.LazyPaths(obj))
         return Scope.Scope.deserialize(obj, '.', {})
 
 interpreter = None
@@ -0,0 +1,464 @@
+'''
+Lowers the definitions of numeric user functions to Python functions of float arguments, which are compiled with numba
+when it is installed and with compile otherwise.
+A definition can be lowered if it is built only from numbers, parameters, float variables, operators, ifelse, the math
+builtins and calls of user functions that can be lowered themselves. Calls of the function itself in tail position
+become a loop. Other calls of functions with a memo go through the memo, as they do when interpreted, so memoized
+recursion stays fast. Numba code cannot call back into the memo, so such calls are not lowered with numba. A definition
+holding anything else raises JitError, and the function is interpreted as before.
+Without numba the generated code calls the same operator functions as the interpreter, so results are unchanged to the
+last bit. Numba compiles operators and math functions to machine code, whose results can differ in the last bit.
+'''
+from collections import OrderedDict
+import numpy as np
+import Function
+import Operators
+import Optimizer
+
+class JitError(Exception):
+    '''
+    Raised when a definition contains a construct that cannot be lowered
+    '''
+    pass
+
+# Whether to compile with numba when it is installed
+use_numba = True
+
+# Number of generated sources whose code objects are kept, so that functions with the same definition, such as the
+# lambdas made by each call of a function, are only compiled once
+code_cache_size = 1024
+code_cache = OrderedDict()
+
+# Functions compiled by numba, by their source and the values of their globals
+numba_cache = OrderedDict()
+
+# The name of the generated function
+FUNCTION_NAME = '_function'
+
+# Names the generated Python code calls the operator functions by
+BINARY_NAMES = {
+    '^': '_power',
+    '*': '_multiply',
+    '/': '_divide',
+    '%': '_mod',
+    '+': '_add',
+    '-': '_subtract',
+    '>': '_greater',
+    '<': '_less',
+    '>=': '_greater_equal',
+    '<=': '_less_equal',
+    '==': '_equal',
+    'eq': '_equal',
+    '!=': '_not_equal',
+    'neq': '_not_equal',
+    'and': '_logical_and',
+    'or': '_logical_or'
+}
+UNARY_NAMES = {
+    '+': '_positive',
+    '-': '_negative',
+    '!': '_logical_not',
+    'not': '_logical_not'
+}
+
+# Source of the operators and math functions for numba, which compiles them to machine arithmetic.
+# Truth values are compared with 0 the way numpy's logical functions test them.
+NUMBA_BINARY = {
+    '^': '({} ** {})',
+    '*': '({} * {})',
+    '/': '({} / {})',
+    '%': '({} % {})',
+    '+': '({} + {})',
+    '-': '({} - {})',
+    '>': '({} > {})',
+    '<': '({} < {})',
+    '>=': '({} >= {})',
+    '<=': '({} <= {})',
+    '==': '({} == {})',
+    'eq': '({} == {})',
+    '!=': '({} != {})',
+    'neq': '({} != {})',
+    'and': '(({} != 0) & ({} != 0))',
+    'or': '(({} != 0) | ({} != 0))'
+}
+NUMBA_UNARY = {
+    '+': '(+{})',
+    '-': '(-{})',
+    '!': '({} == 0)',
+    'not': '({} == 0)'
+}
+NUMBA_FUNCTIONS = {
+    'sin': 'np.sin({})',
+    'cos': 'np.cos({})',
+    'tan': 'np.tan({})',
+    'arcsin': 'np.arcsin({})',
+    'arccos': 'np.arccos({})',
+    'arctan': 'np.arctan({})',
+    'arctan2': 'np.arctan2({}, {})',
+    'sqrt': 'np.sqrt({})',
+    'exp': 'np.exp({})',
+    'ln': 'np.log({})',
+    'log': '(np.log({}) / _ln_10)',
+    'log2': 'np.log2({})',
+    'logb': '(np.log({}) / np.log({}))'
+}
+
+# Operators giving a truth value. The others give a float, and under numba must be applied to floats, since numba
+# treats truth values as integers where numpy would not.
+COMPARISONS = {'>', '<', '>=', '<=', '==', 'eq', '!=', 'neq', 'and', 'or'}
+
+# The functions being lowered, whose calls of each other cannot be lowered
+_lowering = set()
+
+# The numba module, False if it is not installed, or None if it has not been imported yet
+_numba = None
+
+def get_numba():
+    '''
+    Returns the numba module, or None if it is not installed or use_numba is off
+    '''
+    global _numba
+    if not use_numba:
+        return None
+    if _numba is None:
+        try:
+            import numba
+            _numba = numba
+        except ImportError:
+            _numba = False
+    return _numba or None
+
+def jit_function(function, definition, dependencies):
+    '''
+    Lowers the definition of a user function, returning a Lowered function, or False if it cannot be lowered, along
+    with the names the lowering relied on, to be checked with still_valid before the function is used again.
+    definition:     The definition to lower, after constant folding
+    dependencies:   The names constant folding relied on
+    '''
+    lowering = Lowering(function, dependencies)
+    _lowering.add(function)
+    try:
+        return lowering.lower(definition), lowering.dependencies
+    except JitError:
+        return False, lowering.dependencies
+    finally:
+        _lowering.discard(function)
+
+def still_valid(dependencies):
+    '''
+    Checks that every name a lowered function or the functions it calls relied on still has the same value
+    '''
+    return all(Optimizer.still_valid(names, scope) for scope, names in dependencies)
+
+def compile_source(source, namespace):
+    '''
+    Executes the source of a generated function in the namespace, returning the function
+    '''
+    code = code_cache.get(source)
+    if code is None:
+        code = compile(source, '<jit>', 'exec')
+        code_cache[source] = code
+        if len(code_cache) > code_cache_size:
+            code_cache.popitem(last=False)
+    else:
+        code_cache.move_to_end(source)
+    exec(code, namespace)
+    return namespace[FUNCTION_NAME]
+
+def get_call(AST):
+    '''
+    Returns the function call node an expression consists of, or None if it is any other expression
+    '''
+    if len(AST) != 2 or AST[0] != 'expression' or AST[1] == ():
+        return None
+    node = AST[1]
+    if node[0] != 'infix' or len(node) != 2:
+        return None
+    node = node[1]
+    if node[0] != 'operand' or len(node) != 2 or len(node[1]) < 2 or node[1][0] != 'function_call':
+        return None
+    return node[1]
+
+class Lowered():
+    '''
+    A user function's definition lowered to a function of float arguments
+    '''
+    def __init__(self, func, kind, numba, dependencies):
+        self.func = func
+        self.kind = kind
+        self.numba = numba
+        self.dependencies = dependencies
+
+    def call(self, values):
+        '''
+        Returns the value of the function for the given values, or None if they are not all floats or numpy's error
+        model raised an error, in which case the interpreter should evaluate the call and report any error itself
+        '''
+        for value in values:
+            if type(value) not in Operators.SCALAR_TYPES:
+                return None
+        try:
+            result = self.func(*values)
+        except (FloatingPointError, OverflowError):
+            return None
+        if self.numba:
+            return np.bool_(result) if self.kind == 'bool' else np.float64(result)
+        return result
+
+class Lowering():
+    '''
+    Generates the source of a lowered function. Each lowered expression is returned with its kind, 'float' or 'bool',
+    which numba needs to type the function.
+    '''
+    def __init__(self, function, dependencies):
+        self.function = function
+        self.scope = function.get_parent_scope()
+        self.numba = get_numba()
+        self.names = {}
+        self.dependencies = [(self.scope, dependencies), (self.scope, self.names)]
+        self.params = {}
+        self.kinds = set()
+        self.self_calls = False
+        if self.numba is not None:
+            self.namespace = {'np': np, '_ln_10': Operators.LN_10}
+        else:
+            self.namespace = {name: Operators.BINARY[raw] for raw, name in BINARY_NAMES.items()}
+            self.namespace.update({name: Operators.UNARY[raw] for raw, name in UNARY_NAMES.items()})
+
+    def lower(self, definition):
+        param_names = self.function.get_param_names()
+        if 'self' in param_names or len(set(param_names)) != len(param_names):
+            raise JitError('Parameters that shadow self or each other cannot be lowered')
+        self.params = {name: 'p{}'.format(i) for i, name in enumerate(param_names)}
+
+        lines = self.lower_tail(definition, 2)
+        source = 'def {}({}):\n    while True:\n{}\n'.format(FUNCTION_NAME, ', '.join(self.params.values()), '\n'.join(lines))
+        if len(self.kinds) != 1 or (self.self_calls and self.kinds != {'float'}):
+            if self.numba is not None:
+                raise JitError('Numba needs every return value to be of the same kind')
+        kind = self.kinds.pop() if len(self.kinds) == 1 else 'float'
+
+        if self.numba is None:
+            return Lowered(compile_source(source, self.namespace), kind, False, self.dependencies)
+        return Lowered(self.compile_numba(source, kind), kind, True, self.dependencies)
+
+    def compile_numba(self, source, kind):
+        key = (source, tuple(sorted(((name, value) for name, value in self.namespace.items() if name != 'np'),
+            key=lambda item: item[0])))
+        dispatcher = numba_cache.get(key)
+        if dispatcher is None:
+            numba = self.numba
+            dispatcher = numba.njit(error_model='numpy')(compile_source(source, self.namespace))
+
+            # Recursive calls refer to the compiled function, so it must be in the namespace before it is compiled
+            self.namespace[FUNCTION_NAME] = dispatcher
+            result_type = numba.boolean if kind == 'bool' else numba.float64
+            try:
+                dispatcher.compile(result_type(*[numba.float64] * len(self.params)))
+            except Exception as err:
+                raise JitError('Numba could not compile the function: {}'.format(err))
+            numba_cache[key] = dispatcher
+            if len(numba_cache) > code_cache_size:
+                numba_cache.popitem(last=False)
+        return dispatcher
+
+    def memoized(self, target):
+        '''
+        Returns whether calls of a user function go through its memo. Numba code cannot call back into the memo, so
+        raises JitError under numba if they do.
+        '''
+        if Function.UserFunction.memo_size == 0 or target.get_memo() is None:
+            return False
+        if self.numba is not None:
+            raise JitError('Numba code cannot call through the memo of a function')
+        return True
+
+    def memo_call(self, target, values):
+        '''
+        Returns the source of a call of a user function through its memo, as the interpreter would make it
+        '''
+        return '{}([{}])'.format(self.constant(target.evaluate_values), ', '.join(values))
+
+    def constant(self, value):
+        name = '_c{}'.format(len(self.namespace))
+        self.namespace[name] = value
+        return name
+
+    def lookup(self, name):
+        '''
+        Returns the value of a name that is not a parameter, recording it as a dependency
+        '''
+        value = Optimizer.resolve(self.scope, name)
+        self.names[name] = value
+        return value
+
+    def require_floats(self, kinds):
+        if self.numba is not None and any(kind != 'float' for kind in kinds):
+            raise JitError('Numba treats truth values as integers')
+
+    def lower_tail(self, AST, depth):
+        '''
+        Returns the lines of statements that return the value of an expression in tail position
+        '''
+        indent = '    ' * depth
+        call = get_call(AST)
+        if call is not None:
+            target, args = self.resolve_call(call)
+            if target == 'ifelse':
+                condition, _ = self.lower_node(args[0])
+                return [indent + 'if {}:'.format(condition)] + self.lower_tail(args[1], depth + 1) + \
+                    [indent + 'else:'] + self.lower_tail(args[2], depth + 1)
+            elif target is self.function:
+                values, kinds = self.lower_args(args)
+                self.require_floats(kinds)
+                lines = []
+                if len(values) > 0:
+                    lines.append(indent + '{} = {}'.format(', '.join(self.params.values()), ', '.join(values)))
+                return lines + [indent + 'continue']
+        value, kind = self.lower_node(AST)
+        self.kinds.add(kind)
+        return [indent + 'return {}'.format(value)]
+
+    def lower_args(self, args):
+        lowered = [self.lower_node(arg) for arg in args]
+        return [value for value, _ in lowered], [kind for _, kind in lowered]
+
+    def resolve_call(self, call):
+        '''
+        Returns what a function call calls, which is 'ifelse', the name of a math builtin or a user function, and its
+        arguments
+        '''
+        callable = call[1]
+        if callable[0] != 'name' or len(callable) != 2 or len(call) != 3 or call[2][0] != 'params':
+            raise JitError('Only calls of a function by name with one set of arguments can be lowered')
+        name = callable[1][0].value
+        args = () if call[2][1:] == ((),) else call[2][1:]
+        if name in self.params:
+            raise JitError('Functions passed as arguments cannot be lowered')
+        value = self.function if name == 'self' else self.lookup(name)
+
+        if isinstance(value, Function.UserFunction):
+            if len(args) != len(value.get_param_names()):
+                raise JitError('Calls with the wrong number of arguments are left to the interpreter')
+            return value, args
+        elif isinstance(value, Function.BuiltinFunction):
+            if len(args) != len(value.get_param_names()):
+                raise JitError('Calls with the wrong number of arguments are left to the interpreter')
+            if value.get_name() == 'ifelse':
+                return 'ifelse', args
+            elif value.get_name() in Operators.FUNCTIONS:
+                return value.get_name(), args
+        raise JitError('Only calls of ifelse, math builtins and user functions can be lowered')
+
+    def lower_node(self, node):
+        '''
+        Returns the source of an expression and its kind
+        '''
+        if len(node) < 2:
+            raise JitError('Empty nodes cannot be lowered')
+        label = node[0]
+        args = node[1:]
+        if label == 'expression':
+            if args[0] == ():
+                raise JitError('Empty expressions cannot be lowered')
+            return self.lower_node(args[0])
+        elif label == 'infix':
+            value, kind = self.lower_node(args[0])
+            for operator, operand in zip(args[1::2], args[2::2]):
+                raw = operator[1][0].value
+                if raw not in BINARY_NAMES:
+                    raise JitError('Unknown operator')
+                value2, kind2 = self.lower_node(operand)
+                if raw not in COMPARISONS:
+                    self.require_floats([kind, kind2])
+                if self.numba is not None:
+                    value = NUMBA_BINARY[raw].format(value, value2)
+                else:
+                    value = '{}({}, {})'.format(BINARY_NAMES[raw], value, value2)
+                kind = 'bool' if raw in COMPARISONS else 'float'
+            return value, kind
+        elif label == 'operand':
+            return self.lower_operand(args)
+        elif label == 'implicit_mult':
+            value, kind = self.lower_node(args[0])
+            for arg in args[1:]:
+                value2, kind2 = self.lower_node(arg)
+                self.require_floats([kind, kind2])
+                if self.numba is not None:
+                    value = NUMBA_BINARY['*'].format(value, value2)
+                else:
+                    value = '{}({}, {})'.format(BINARY_NAMES['*'], value, value2)
+                kind = 'float'
+            return value, kind
+        elif label == 'name':
+            return self.lower_name(node)
+        elif label == 'function_call':
+            return self.lower_call(node)
+        raise JitError('\'{}\' nodes cannot be lowered'.format(label))
+
+    def lower_operand(self, args):
+        if len(args) == 1 and len(args[0]) == 1:
+            # A leaf can only be a number
+            value = args[0][0].value
+            if type(value) not in Operators.SCALAR_TYPES:
+                raise JitError('Only float numbers can be lowered')
+            return self.constant(value), 'float'
+        value, kind = self.lower_node(args[-1])
+        for operator in reversed(args[:-1]):
+            raw = operator[1][0].value
+            if raw not in UNARY_NAMES:
+                raise JitError('Unknown unary operator')
+            if raw in ('+', '-'):
+                self.require_floats([kind])
+            if self.numba is not None:
+                value = NUMBA_UNARY[raw].format(value)
+            else:
+                value = '{}({})'.format(UNARY_NAMES[raw], value)
+            kind = 'float' if raw in ('+', '-') else 'bool'
+        return value, kind
+
+    def lower_name(self, node):
+        if len(node) != 2:
+            raise JitError('Dotted names cannot be lowered')
+        name = node[1][0].value
+        if name in self.params:
+            return self.params[name], 'float'
+        if name == 'self':
+            raise JitError('Functions as values cannot be lowered')
+        value = self.lookup(name)
+        if type(value) in Operators.SCALAR_TYPES:
+            return self.constant(value), 'float'
+        elif type(value) in (bool, np.bool_):
+            return self.constant(value), 'bool'
+        raise JitError('Only float and truth value variables can be lowered')
+
+    def lower_call(self, call):
+        target, args = self.resolve_call(call)
+        values, kinds = self.lower_args(args)
+        if target == 'ifelse':
+            if self.numba is not None and kinds[1] != kinds[2]:
+                raise JitError('Numba needs both values of ifelse to be of the same kind')
+            return '({} if {} else {})'.format(values[1], values[0], values[2]), kinds[1]
+        elif type(target) == str:
+            self.require_floats(kinds)
+            if self.numba is not None:
+                return NUMBA_FUNCTIONS[target].format(*values), 'float'
+            name = '_{}'.format(target)
+            self.namespace[name] = Operators.FUNCTIONS[target]
+            return '{}({})'.format(name, ', '.join(values)), 'float'
+
+        self.require_floats(kinds)
+        if target is self.function:
+            self.self_calls = True
+            if self.memoized(target):
+                return self.memo_call(target, values), 'float'
+            return '{}({})'.format(FUNCTION_NAME, ', '.join(values)), 'float'
+        if target in _lowering:
+            raise JitError('Functions that call each other cannot be lowered')
+        lowered = target.get_jitted()
+        if not lowered or lowered.numba != (self.numba is not None):
+            raise JitError('Calls of functions that cannot be lowered are left to the interpreter')
+        self.dependencies.extend(lowered.dependencies)
+        if self.memoized(target):
+            return self.memo_call(target, values), lowered.kind
+        return '{}({})'.format(self.constant(lowered.func), ', '.join(values)), lowered.kind
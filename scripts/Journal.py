@@ -0,0 +1,154 @@
+'''
+Incremental saves. A journaled save is a save file plus a journal next to it, named after it with .journal appended,
+listing the names set or deleted since the save file was written, one JSON object per line:
+    {"op": "set", "name": "f", "entry": [<serialized value>, true], "save": "<save id>"}
+    {"op": "delete", "name": "f", "save": "<save id>"}
+Checkpoints only append the names changed since the last one, so they stay fast however large the scope is.
+Once the journal grows long it is compacted into a new save file, which replaces the old one atomically.
+Every save written here has a random id, which its journal records carry. Records of an earlier save, left behind by
+a crash between replacing the save and removing its journal, are ignored when replaying, since the save already holds
+them. Replaying a journal is idempotent, so a crash at any point leaves a save that loads to the last checkpoint or
+later.
+'''
+import json
+import os
+import uuid
+import Interpreter
+import Function
+import Scope
+from Serialize import ProgramEncoder, json_program_obj_hook, dump_save, load_save
+
+def journal_path(path):
+    return '{}.journal'.format(path)
+
+def write_save(obj, path):
+    '''
+    Writes a full save under a new id, which dump_save replaces atomically, returning the id.
+    Any journal of the previous save is removed, since the new save already holds its changes.
+    '''
+    save_id = uuid.uuid4().hex
+    if type(obj) == dict:
+        obj = dict(obj, save_id=save_id)
+    dump_save(obj, path)
+    if os.path.isfile(journal_path(path)):
+        os.remove(journal_path(path))
+    return save_id
+
+def get_save_id(obj):
+    '''
+    Returns the id of a loaded save, or None for saves written without one
+    '''
+    return obj.get('save_id') if type(obj) == dict else None
+
+def read_save_id(path):
+    try:
+        return get_save_id(load_save(path))
+    except (OSError, ValueError):
+        return None
+
+def read_records(path, save_id):
+    '''
+    Returns the records of a save's journal written for the save with the given id. An incomplete last line, left by
+    a crash while appending, is ignored.
+    '''
+    if not os.path.isfile(journal_path(path)):
+        return []
+    with open(journal_path(path), 'r') as f:
+        lines = f.read().split('\n')
+    records = []
+    for line in lines:
+        if line.strip() == '':
+            continue
+        try:
+            record = json.loads(line, object_hook=json_program_obj_hook)
+        except ValueError:
+            break
+        if record.get('save') == save_id:
+            records.append(record)
+    return records
+
+def replay(path, scope, save_id):
+    '''
+    Applies the journal of a save to the scope loaded from it, returning the number of records applied
+    save_id:    The id of the loaded save, from get_save_id
+    '''
+    records = read_records(path, save_id)
+    for record in records:
+        name = record['name']
+        if record['op'] == 'set':
+            entry_path = '{}/symbol_table/{}'.format('.', name)
+            scope._symbol_table[name] = Scope.Scope.deserialize_entry(record['entry'], entry_path, {'.': scope})
+        elif name in scope._symbol_table:
+            del scope._symbol_table[name]
+    return len(records)
+
+def load_scope(path, lazy=True):
+    '''
+    Loads the scope of a save, including the changes recorded in its journal
+    '''
+    obj = load_save(path)
+    scope = Interpreter.Interpreter.deserialize(obj, lazy=lazy)
+    replay(path, scope, get_save_id(obj))
+    return scope
+
+class Journal():
+    '''
+    Records the changes made to a scope loaded from a save, so that checkpoints only write what changed
+    '''
+    def __init__(self, path, scope, compact_after=1000):
+        self._path = path
+        self._scope = scope
+        self._compact_after = compact_after
+        self._save_id = read_save_id(path)
+        self._records = len(read_records(path, self._save_id))
+        self._repair()
+        scope.track_changes()
+
+    def _repair(self):
+        '''
+        Cuts off an incomplete last line, so that appended records start on a line of their own
+        '''
+        if not os.path.isfile(journal_path(self._path)):
+            return
+        with open(journal_path(self._path), 'rb+') as f:
+            data = f.read()
+            if len(data) > 0 and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def checkpoint(self):
+        '''
+        Appends the names changed since the last checkpoint to the journal, compacting it if it has grown too long.
+        Returns the number of names written.
+        '''
+        changes = self._scope.take_changes()
+        if len(changes) == 0:
+            return 0
+        if self._records + len(changes) > self._compact_after:
+            self.compact()
+            return len(changes)
+
+        lines = []
+        for name in sorted(changes):
+            entry = self._scope._symbol_table.get(name)
+            if entry is None:
+                record = {'op': 'delete', 'name': name, 'save': self._save_id}
+            else:
+                value, mutable = entry
+                if isinstance(value, Function.Function):
+                    value = value.serialize('{}/symbol_table/{}'.format('.', name), {self._scope: '.'})
+                record = {'op': 'set', 'name': name, 'entry': (value, mutable), 'save': self._save_id}
+            lines.append(json.dumps(record, cls=ProgramEncoder) + '\n')
+        with open(journal_path(self._path), 'a') as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self._records += len(lines)
+        return len(lines)
+
+    def compact(self):
+        '''
+        Writes the whole scope to a new save file and empties the journal
+        '''
+        self._scope.take_changes()
+        self._save_id = write_save(self._scope.serialize('.', {}), self._path)
+        self._records = 0
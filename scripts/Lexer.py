@@ -1,35 +1,51 @@
 import re
-import numpy as np
+import sys
 
 class Token():
-    WORD = 'WORD'
-    NUMBER = 'NUMBER'
-    OPERATOR = 'OPERATOR'
-    STRING = 'STRING'
+    '''
+    A token's kind is stored as a small integer, and the type property gives its name for display and serialization.
+    Tokens have no instance dictionary, and the values of non-number tokens are interned.
+    '''
+    __slots__ = ('kind', 'value')
+
+    WORD = 0
+    NUMBER = 1
+    OPERATOR = 2
+    STRING = 3
+    TYPE_NAMES = ('WORD', 'NUMBER', 'OPERATOR', 'STRING')
+    KINDS = {name: kind for kind, name in enumerate(TYPE_NAMES)}
+    UNARY_OPERATORS = frozenset(['+', '-', '!', 'not'])
 
     def __init__(self, atype, value):
-        self.type = atype
+        if type(atype) == str:
+            atype = Token.KINDS[atype]
+        self.kind = atype
         if atype == Token.NUMBER:
-            self.value = np.float(value)
+            self.value = float(value)
         else:
-            self.value = value
+            self.value = sys.intern(value)
+
+    @property
+    def type(self):
+        return Token.TYPE_NAMES[self.kind]
     
     def __repr__(self):
-        if self.type == Token.NUMBER:
+        if self.kind == Token.NUMBER:
             return '{}: {}'.format(self.type, str(self.value))
         else:
             return '{}: \'{}\''.format(self.type, str(self.value))
 
     def is_unary_operator(token):
-        return token.type == Token.OPERATOR and token.value in ['+', '-', '!', 'not']
+        return token.kind == Token.OPERATOR and token.value in Token.UNARY_OPERATORS
     
     def is_number(token):
-        return token.type == Token.NUMBER
+        return token.kind == Token.NUMBER
 
     def is_word(token):
-        return token.type == Token.WORD
+        return token.kind == Token.WORD
 
     def is_value(*values):
+        values = frozenset(values)
         return lambda token: token.value in values
 
 def apply_pattern(tokens, pattern, callback):
@@ -51,7 +67,54 @@ def apply_pattern(tokens, pattern, callback):
             new_tokens.append(string)
     return new_tokens
 
+# The lexer recognizes numbers first, across the whole string. Whatever is left between numbers is then split into
+# operators, words, whitespace and single characters, in that order of preference. Word boundaries in the second
+# pattern are checked against these fragments, which is what lets '2x' lex as a number followed by a word.
+number_pattern = re.compile(r'(?<!\w)(?:\d+\.\d+|\.\d+|\d+\.|\d+|\bInf\b|\bNaN\b)(?=\s|\b|\w)')
+fragment_pattern = re.compile(
+    r'(?P<OPERATOR>\band\b|\bor\b|\bneq\b|\beq\b|\bnot\b|[!><=]=|[\^*\/%+\-><!=])'
+    r'|(?P<WORD>\b[a-zA-Z_]\w*\b)'
+    r'|(?P<WHITESPACE>\s+)'
+    r'|(?P<STRING>.)'
+)
+
+# Token kinds of the groups of the fragment pattern, indexed by group number. Whitespace has no token.
+fragment_kinds = (None, Token.OPERATOR, Token.WORD, None, Token.STRING)
+
+def tokenize_fragment(fragment, tokens):
+    for match in fragment_pattern.finditer(fragment):
+        kind = fragment_kinds[match.lastindex]
+        if kind is not None:
+            tokens.append(Token(kind, match[0]))
+
 def tokenize(string):
+    '''
+    Splits a string into tokens in a single pass over it
+    '''
+    tokens = []
+    previous = 0
+    for match in number_pattern.finditer(string):
+        start, end = match.span()
+        if start != previous:
+            tokenize_fragment(string[previous:start], tokens)
+        tokens.append(Token(Token.NUMBER, match[0]))
+        previous = end
+    if previous != len(string):
+        tokenize_fragment(string[previous:], tokens)
+    return tokens
+
+def tokenize_stream(lines):
+    '''
+    Lazily yields the tokens of an iterable of lines, such as an open file.
+    Lines must keep their line endings (as file iteration does) so that no token spans two lines.
+    '''
+    for line in lines:
+        yield from tokenize(line)
+
+def tokenize_multipass(string):
+    '''
+    The original lexer, which applies one pattern at a time to the whole string. Kept to cross-check tokenize.
+    '''
     number_pattern = re.compile(r'(?<!\w)(?:\d+\.\d+|\.\d+|\d+\.|\d+|\bInf\b|\bNaN\b)(?=\s|\b|\w)')
     tokens = apply_pattern([string], number_pattern, lambda value: Token(Token.NUMBER, value))
 
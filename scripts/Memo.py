@@ -0,0 +1,73 @@
+'''
+Memoization of pure user functions.
+A function is pure if its definition cannot delete names, create lambdas or leave the calculator, and every name it
+reads from outside its own frame holds a value or a pure function. The values it read are recorded as dependencies,
+and its memo is cleared as soon as any of them has been replaced.
+'''
+from collections import OrderedDict
+import numpy as np
+
+# Arrays with more elements than this are not used as keys
+MAX_ARRAY_SIZE = 64
+
+def make_key(values):
+    '''
+    Returns a hashable key identifying a list of argument values, or None if one of them cannot be part of a key.
+    Floats are keyed by their exact representation, which keeps -0.0 apart from 0.0, and types are part of the key
+    since they can change the type of the result.
+    '''
+    key = []
+    for value in values:
+        value_type = type(value)
+        if value_type == float or value_type == np.float64:
+            key.append((value_type, float(value).hex()))
+        elif value_type == int or value_type == bool or value_type == np.bool_:
+            key.append((value_type, value))
+        elif value_type == np.ndarray and value.size <= MAX_ARRAY_SIZE and value.dtype != object:
+            key.append((value_type, value.dtype.str, value.shape, value.tobytes()))
+        else:
+            return None
+    return tuple(key)
+
+class Memo():
+    '''
+    Bounded least recently used table of the results of a pure function
+    '''
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._table = OrderedDict()
+
+    def __len__(self):
+        return len(self._table)
+
+    def get(self, key):
+        '''
+        Returns the (result,) stored for the key, or None if there is none
+        '''
+        entry = self._table.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._table.move_to_end(key)
+        return entry
+
+    def put(self, key, result):
+        self._table[key] = (result,)
+        while len(self._table) > self.maxsize:
+            self._table.popitem(last=False)
+
+    def clear(self):
+        self._table.clear()
+
+    def stats(self):
+        calls = self.hits + self.misses
+        hit_rate = self.hits / calls if calls > 0 else 0.0
+        return np.array([self.hits, self.misses, hit_rate, len(self._table)], dtype=np.float64)
+
+def same_dependencies(first, second):
+    if first is None or second is None or len(first) != len(second):
+        return False
+    return all(name1 == name2 and value1 is value2 for (name1, value1), (name2, value2) in zip(first, second))
@@ -0,0 +1,167 @@
+'''
+Tables of the functions infix and unary operators evaluate to, and the scalar versions of math builtins.
+Operators and functions applied to plain floats are computed with Python's own float operations and the math module,
+which skip the overhead of calling a ufunc. Their results are the same numpy scalars the ufuncs return, to the last
+bit. Anything else, and any result that is not finite, goes through the ufunc, so arrays, warnings and division by
+zero are handled by numpy as before. Powers and the math functions not listed here always use numpy, since its
+results can differ from the C library's in the last bit.
+'''
+import math
+import operator
+import numpy as np
+
+# Types of values that can take the scalar path
+SCALAR_TYPES = {float, np.float64}
+
+def add(value1, value2):
+    if type(value1) in SCALAR_TYPES and type(value2) in SCALAR_TYPES:
+        result = float(value1) + float(value2)
+        if result - result == 0.0:
+            return np.float64(result)
+    return np.add(value1, value2)
+
+def subtract(value1, value2):
+    if type(value1) in SCALAR_TYPES and type(value2) in SCALAR_TYPES:
+        result = float(value1) - float(value2)
+        if result - result == 0.0:
+            return np.float64(result)
+    return np.subtract(value1, value2)
+
+def multiply(value1, value2):
+    if type(value1) in SCALAR_TYPES and type(value2) in SCALAR_TYPES:
+        result = float(value1) * float(value2)
+        if result - result == 0.0:
+            return np.float64(result)
+    return np.multiply(value1, value2)
+
+def divide(value1, value2):
+    if type(value1) in SCALAR_TYPES and type(value2) in SCALAR_TYPES and value2 != 0.0:
+        result = float(value1) / float(value2)
+        if result - result == 0.0:
+            return np.float64(result)
+    return np.divide(value1, value2)
+
+def mod(value1, value2):
+    # Python's float modulo takes the sign of the divisor, as np.mod does
+    if type(value1) in SCALAR_TYPES and type(value2) in SCALAR_TYPES and value2 != 0.0:
+        result = float(value1) % float(value2)
+        if result - result == 0.0:
+            return np.float64(result)
+    return np.mod(value1, value2)
+
+def make_comparison(ufunc, native):
+    '''
+    Returns a comparison that compares plain floats natively, giving a numpy bool as the ufunc does
+    '''
+    def compare(value1, value2):
+        if type(value1) in SCALAR_TYPES and type(value2) in SCALAR_TYPES:
+            return np.True_ if native(value1, value2) else np.False_
+        return ufunc(value1, value2)
+    return compare
+
+def logical_and(value1, value2):
+    if type(value1) in SCALAR_TYPES and type(value2) in SCALAR_TYPES:
+        return np.True_ if value1 and value2 else np.False_
+    return np.logical_and(value1, value2)
+
+def logical_or(value1, value2):
+    if type(value1) in SCALAR_TYPES and type(value2) in SCALAR_TYPES:
+        return np.True_ if value1 or value2 else np.False_
+    return np.logical_or(value1, value2)
+
+greater = make_comparison(np.greater, operator.gt)
+less = make_comparison(np.less, operator.lt)
+greater_equal = make_comparison(np.greater_equal, operator.ge)
+less_equal = make_comparison(np.less_equal, operator.le)
+equal = make_comparison(np.equal, operator.eq)
+not_equal = make_comparison(np.not_equal, operator.ne)
+
+def negative(value):
+    if type(value) in SCALAR_TYPES:
+        return np.float64(-float(value))
+    return np.negative(value)
+
+def positive(value):
+    if type(value) in SCALAR_TYPES:
+        return np.float64(value)
+    return np.positive(value)
+
+def logical_not(value):
+    if type(value) in SCALAR_TYPES:
+        return np.False_ if value else np.True_
+    return np.logical_not(value)
+
+def make_function(ufunc, native):
+    '''
+    Returns a function of one value that calls the math module's version on plain floats. Values outside its domain
+    raise ValueError there, and are left to the ufunc along with results that are not finite.
+    '''
+    def apply(value):
+        if type(value) in SCALAR_TYPES:
+            try:
+                result = native(value)
+            except (ValueError, OverflowError):
+                return ufunc(value)
+            if result - result == 0.0:
+                return np.float64(result)
+        return ufunc(value)
+    return apply
+
+# numpy computes these with the C library for float64, or rounds them correctly, so the results match math's
+sin = make_function(np.sin, math.sin)
+cos = make_function(np.cos, math.cos)
+sqrt = make_function(np.sqrt, math.sqrt)
+
+# The natural logarithm of 10, which log divides by
+LN_10 = np.log(10)
+
+def log(value):
+    return np.log(value) / LN_10
+
+def logb(value, base):
+    return np.log(value) / np.log(base)
+
+# Functions of the infix operators, by their raw token value
+BINARY = {
+    '^': np.power,
+    '*': multiply,
+    '/': divide,
+    '%': mod,
+    '+': add,
+    '-': subtract,
+    '>': greater,
+    '<': less,
+    '>=': greater_equal,
+    '<=': less_equal,
+    '==': equal,
+    'eq': equal,
+    '!=': not_equal,
+    'neq': not_equal,
+    'and': logical_and,
+    'or': logical_or
+}
+
+# Functions of the unary operators, by their raw token value
+UNARY = {
+    '+': positive,
+    '-': negative,
+    '!': logical_not,
+    'not': logical_not
+}
+
+# Functions of the elementwise math builtins, by name
+FUNCTIONS = {
+    'sin': sin,
+    'cos': cos,
+    'tan': np.tan,
+    'arcsin': np.arcsin,
+    'arccos': np.arccos,
+    'arctan': np.arctan,
+    'arctan2': np.arctan2,
+    'sqrt': sqrt,
+    'exp': np.exp,
+    'ln': np.log,
+    'log': log,
+    'log2': np.log2,
+    'logb': logb
+}
@@ -0,0 +1,244 @@
+'''
+Constant folding for abstract syntax trees.
+Operands made only of numbers, immutable builtin constants such as pi and calls of pure elementwise builtins on them
+are evaluated once and replaced by a number, as are the leading constant terms of infix chains and implicit
+multiplications. Folded values are computed by the interpreter itself in the order evaluation would compute them,
+so results are unchanged to the last bit. Only finite floats are folded, so errors, warnings and values of any other
+type still come from evaluation as before.
+'''
+import numpy as np
+import Analysis
+import Function
+import Interpreter
+from Lexer import Token
+
+def optimize(AST, scope, bound=()):
+    '''
+    Returns the tree with its constant subexpressions folded, and a dict of the names whose values the folding relied
+    on, to be checked with still_valid before the folded tree is used again.
+    scope:      The scope the tree is evaluated in, or the parent scope of the function it defines
+    bound:      Names bound in the scope the tree runs in, such as a function's parameters, which are never folded
+    '''
+    folder = Folder(scope, set(bound) | Analysis.get_binder_names(AST) | get_assigned_names(AST))
+    return folder.fold(AST), folder.dependencies
+
+def get_assigned_names(AST):
+    '''
+    Returns the names a program defines, whose values may change while it runs
+    '''
+    names = set()
+    if type(AST) == tuple and len(AST) > 0 and AST[0] == 'program':
+        for line in AST[1:]:
+            if len(line) == 2 and line[1] != ():
+                if line[1][0] == 'var_def':
+                    names.update(word[0].value for word in line[1][1:-1])
+                elif line[1][0] == 'function_def':
+                    names.add(line[1][1][0].value)
+    return names
+
+# Stands for any user function in dependencies. Keeping the function itself would keep its scope alive.
+USER_FUNCTION = object()
+
+def still_valid(dependencies, scope):
+    '''
+    Checks that every name a folded tree relied on still refers to the same value in the scope
+    '''
+    for name, value in dependencies.items():
+        current = resolve(scope, name)
+        if value is USER_FUNCTION:
+            if not isinstance(current, Function.UserFunction):
+                return False
+        elif current is not value:
+            return False
+    return True
+
+def resolve(scope, name):
+    '''
+    Returns the value of a name in the scope, or None if it is not defined.
+    The scopes searched are watched, so redefining the name later changes Scope._generation.
+    '''
+    owner = scope.find_owner(name) if scope is not None else None
+    if owner is None:
+        return None
+    return owner.retrieve_value(name)
+
+def make_number(value):
+    '''
+    Returns an operand holding a folded value. The value keeps its type, so folded and evaluated results match.
+    '''
+    token = Token(Token.NUMBER, 0.0)
+    token.value = value
+    return ('operand', (token,))
+
+def number_value(node):
+    '''
+    Returns the value of an operand or infix child that is a number, or None
+    '''
+    if node[0] == 'infix' and len(node) == 2:
+        node = node[1]
+    if node[0] == 'operand' and len(node) == 2 and type(node[1][0]) is Token and node[1][0].kind == Token.NUMBER:
+        return node[1][0].value
+    return None
+
+def is_number_expression(node):
+    return len(node) == 2 and node[0] == 'expression' and node[1] != () and node[1][0] == 'infix' and \
+        number_value(node[1]) is not None
+
+class Folder():
+    def __init__(self, scope, bound):
+        self._scope = scope
+        self._bound = bound
+        self._interpreter = Interpreter.Interpreter(scope)
+        self.dependencies = {}
+
+    def _lookup_function(self, name):
+        '''
+        Returns the value of a name that is not bound by the tree if it is a function, recording it as a dependency
+        '''
+        if name in self._bound:
+            return None
+        value = resolve(self._scope, name)
+        if isinstance(value, Function.UserFunction):
+            self.dependencies[name] = USER_FUNCTION
+        elif isinstance(value, Function.BuiltinFunction):
+            self.dependencies[name] = value
+        else:
+            return None
+        return value
+
+    def _constant(self, name):
+        '''
+        Returns whether the name is an immutable builtin constant
+        '''
+        if name in self._bound:
+            return False
+        owner = self._scope.find_owner(name) if self._scope is not None else None
+        if owner is None or not owner._shared:
+            return False
+        value, mutable = owner._symbol_table[name]
+        if mutable or isinstance(value, Function.Function):
+            return False
+        self.dependencies[name] = value
+        return True
+
+    def _evaluate(self, method, *args):
+        '''
+        Returns the value of a constant node as evaluation would compute it, or None if it should not be folded
+        '''
+        # Anything that would warn is left to evaluation, so the warning is still given when the input is evaluated
+        try:
+            with np.errstate(all='raise'):
+                value = method(*args)
+        except Exception:
+            return None
+        if type(value) not in (float, np.float64) or not np.isfinite(value):
+            return None
+        return value
+
+    def fold(self, node):
+        if type(node) != tuple or len(node) == 0 or type(node[0]) != str:
+            return node
+        kind = node[0]
+        if kind == 'function_def':
+            # Definitions are folded by their function when called, since names may be redefined before then
+            return node
+        elif kind == 'operand':
+            return self._fold_operand(node)
+        elif kind == 'infix':
+            return self._fold_infix(node)
+        elif kind == 'implicit_mult':
+            return self._fold_implicit_mult(node)
+        elif kind == 'function_call':
+            return self._fold_function_call(node)
+        elif kind in ('name', 'word_list', 'operator'):
+            return node
+        return (kind,) + tuple(self.fold(arg) for arg in node[1:])
+
+    def _fold_operand(self, node):
+        args = node[1:]
+        if len(args) == 1 and len(args[0]) == 1:
+            return node
+        folded = ('operand',) + tuple(self.fold(arg) for arg in args)
+        inner = folded[-1]
+        if len(args) > 1:
+            # Unary operators applied to a number
+            if number_value(inner) is None:
+                return folded
+        elif inner[0] == 'name':
+            if len(inner) != 2 or not self._constant(inner[1][0].value):
+                return folded
+        elif inner[0] == 'expression':
+            if not is_number_expression(inner):
+                return folded
+            return make_number(number_value(inner[1]))
+        elif inner[0] == 'implicit_mult':
+            if any(number_value(arg) is None for arg in inner[1:]):
+                return folded
+        elif inner[0] == 'function_call':
+            if not self._is_constant_call(inner):
+                return folded
+        else:
+            return folded
+        value = self._evaluate(self._interpreter._evaluate_operand, *folded[1:])
+        return folded if value is None else make_number(value)
+
+    def _fold_infix(self, node):
+        args = tuple(self.fold(arg) for arg in node[1:])
+        if len(args) == 1:
+            return ('infix',) + args
+        if all(number_value(arg) is not None for arg in args[::2]):
+            value = self._evaluate(self._interpreter._evaluate_infix, *args)
+            if value is not None:
+                return ('infix', make_number(value))
+
+        # Evaluation reduces from the left, so a leading run of numbers can be combined ahead of time
+        while len(args) >= 3 and number_value(args[0]) is not None and number_value(args[2]) is not None:
+            value = self._evaluate(self._interpreter._evaluate_infix, *args[:3])
+            if value is None:
+                break
+            args = (make_number(value),) + args[3:]
+        return ('infix',) + args
+
+    def _fold_implicit_mult(self, node):
+        args = tuple(self.fold(arg) for arg in node[1:])
+
+        # A leading parenthesized product is multiplied first anyway, so its terms can join this one
+        first = args[0]
+        if len(first) == 2 and first[1][0] == 'expression' and first[1][1] != () and first[1][1][0] == 'infix' and \
+                len(first[1][1]) == 2 and len(first[1][1][1]) == 2 and first[1][1][1][1][0] == 'implicit_mult':
+            args = first[1][1][1][1][1:] + args[1:]
+
+        count = 0
+        while count < len(args) and number_value(args[count]) is not None:
+            count += 1
+        if 2 <= count < len(args):
+            value = self._evaluate(self._interpreter._evaluate_implicit_mult, *args[:count])
+            if value is not None:
+                args = (make_number(value),) + args[count:]
+        return ('implicit_mult',) + args
+
+    def _fold_function_call(self, node):
+        callable = node[1]
+        value = None
+        if callable[0] == 'name' and len(callable) == 2:
+            value = self._lookup_function(callable[1][0].value)
+
+        # Only the arguments of functions that evaluate them right away are folded. A lambda keeps its definition,
+        # which is folded when it is called.
+        if isinstance(value, Function.UserFunction) or \
+                (isinstance(value, Function.BuiltinFunction) and value.is_pure()):
+            return ('function_call', callable) + tuple(self.fold(arg) for arg in node[2:])
+        return ('function_call', self.fold(callable)) + node[2:]
+
+    def _is_constant_call(self, node):
+        '''
+        Returns whether a folded call is of a pure elementwise builtin with numbers as arguments
+        '''
+        callable = node[1]
+        if callable[0] != 'name' or len(callable) != 2 or len(node) != 3:
+            return False
+        value = self.dependencies.get(callable[1][0].value)
+        if not isinstance(value, Function.BuiltinFunction) or not value.is_pure() or not value.is_elementwise():
+            return False
+        params = node[2][1:]
+        return len(params) > 0 and all(is_number_expression(param) for param in params)
@@ -0,0 +1,105 @@
+'''
+Evaluates one program for many sets of variable bindings across a pool of processes.
+The scope the program runs in and its syntax tree are sent to each worker once, when the worker starts, using the
+same serialization as save files. Tasks then only carry bindings, and are sent in chunks to keep messaging cheap.
+'''
+import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import Interpreter
+import Compiler
+import Function
+import Scope
+from Serialize import ProgramEncoder, json_program_obj_hook
+
+# The state of a worker process, set up once by initialize_worker
+_worker_scope = None
+_worker_AST = None
+_worker_compiled = None
+
+def initialize_worker(scope_json, AST_json, recursion_limit=None):
+    global _worker_scope, _worker_AST, _worker_compiled
+    if recursion_limit is not None:
+        sys.setrecursionlimit(recursion_limit)
+    scope = Interpreter.Interpreter.deserialize(json.loads(scope_json, object_hook=json_program_obj_hook))
+    _worker_scope = Interpreter.Interpreter.get_global_interpreter(subscope=scope)._scope
+    _worker_AST = Function.deserialize_AST(json.loads(AST_json, object_hook=json_program_obj_hook))
+    try:
+        _worker_compiled = Compiler.compile_AST(_worker_AST)
+    except Compiler.CompileError:
+        _worker_compiled = None
+
+def evaluate_bindings(bindings):
+    '''
+    Evaluates the worker's program in a new scope holding the bindings.
+    Returns the result and None, or None and the error message if evaluation failed.
+    Functions are returned as their description, since they hold on to the scope they were defined in.
+    '''
+    scope = Scope.Scope(parent=_worker_scope)
+    for name, value in bindings.items():
+        scope.set_value(name, value)
+    interpreter = Interpreter.Interpreter(scope)
+    try:
+        if _worker_compiled is not None:
+            result = _worker_compiled(interpreter)
+        else:
+            result = interpreter.evaluate_AST(_worker_AST)
+    except Exception as err:
+        return None, str(err) if str(err) != '' else type(err).__name__
+    if isinstance(result, Function.Function):
+        result = repr(result)
+    return result, None
+
+def evaluate_chunk(chunk):
+    return [evaluate_bindings(bindings) for bindings in chunk]
+
+def to_value(value):
+    '''
+    Converts a binding given in Python to the types the calculator uses
+    '''
+    if isinstance(value, (list, tuple)):
+        return np.array([to_value(elem) for elem in value])
+    elif isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+def evaluate_many(program, bindings, scope=None, max_workers=None, chunksize=None, recursion_limit=3000):
+    '''
+    Evaluates a program once for each dict of variable bindings, returning (result, error) pairs in input order.
+    Arguments:
+        program:                Source text or an abstract syntax tree
+        bindings:               A list of dicts mapping names to values
+        scope:                  The scope whose names the program can use, such as an interpreter's scope
+        max_workers:            Number of worker processes, defaulting to the number of CPUs. 1 evaluates in this process.
+        chunksize:              Number of binding sets per task, chosen to give each worker a few tasks by default
+        recursion_limit:        Recursion limit of the worker processes
+    '''
+    if type(program) == str:
+        AST = Interpreter.Interpreter.parse(program)
+    else:
+        AST = program
+    if scope is None:
+        scope = Scope.Scope()
+    scope_json = json.dumps(scope.serialize('.', {}), cls=ProgramEncoder)
+    AST_json = json.dumps(AST, cls=ProgramEncoder)
+    bindings = [{name: to_value(value) for name, value in item.items()} for item in bindings]
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(bindings)))
+    if chunksize is None:
+        chunksize = max(1, math.ceil(len(bindings) / (max_workers * 4)))
+    chunks = [bindings[i:i + chunksize] for i in range(0, len(bindings), chunksize)]
+
+    if max_workers == 1:
+        # Evaluate from the serialized state anyway, so the results match those of worker processes
+        initialize_worker(scope_json, AST_json)
+        results = [evaluate_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=initialize_worker,
+                initargs=(scope_json, AST_json, recursion_limit)) as executor:
+            results = list(executor.map(evaluate_chunk, chunks))
+    return [result for chunk in results for result in chunk]
@@ -0,0 +1,172 @@
+'''
+Differential check of the precedence parser against the combinator parser, and of the lexer against the original multi-pass lexer.
+Random programs are generated from the grammar, optionally corrupted by inserting, deleting or replacing tokens,
+and both parsers must agree on the tree or on the position of the syntax error.
+Random strings of characters are lexed by both lexers, which must produce the same token types and values.
+Run directly: python ParserCheck.py --count 2000 --seed 0
+'''
+import argparse
+import random
+import sys
+import Parsers
+import PrecedenceParser
+from Lexer import tokenize, tokenize_multipass
+
+BINARY_OPERATORS = ['^', '*', '/', '%', '+', '-', '>', '<', '>=', '<=', '!=', '==', 'eq', 'neq', 'and', 'or']
+UNARY_OPERATORS = ['-', '+', '!', 'not']
+NUMBERS = ['1', '2', '0.5', '.5', '3.', '10', 'Inf', 'NaN']
+WORDS = ['a', 'b', 'f', 'g', 'x', 'pi', 'sum', 'lambda']
+CHARACTERS = ['0', '1', '9', '.', 'a', 'x', 'e', '_', ' ', '\n', '\t', '(', ')', '[', ']', ',', ';', '=', '!', '<', '>', '^', '*', '/', '%', '+', '-', '#', 'and', 'or', 'not', 'eq', 'neq', 'Inf', 'NaN']
+NOISE = BINARY_OPERATORS + UNARY_OPERATORS + NUMBERS + WORDS + ['(', ')', '[', ']', ',', ';', '=', '.', '#']
+
+def combinator_parse(tokens):
+    pos_set, tree_dict = Parsers.program(tokens, 0)
+    if len(tokens) in pos_set:
+        return ('tree', tree_dict[len(tokens)][0])
+    elif len(pos_set) == 0:
+        return ('error', None)
+    else:
+        return ('error', max(pos_set))
+
+def precedence_parse(tokens):
+    pos, tree = PrecedenceParser.parse(tokens)
+    if pos == len(tokens):
+        return ('tree', tree)
+    else:
+        return ('error', pos)
+
+def compare(source):
+    '''
+    Parses the source with both parsers, returning None if they agree or a description of the difference
+    '''
+    tokens = tokenize(source)
+    expected = combinator_parse(tokens)
+    actual = precedence_parse(tokens)
+    if expected != actual:
+        return 'source: {}\ncombinator: {}\nprecedence: {}'.format(source, expected, actual)
+    return None
+
+def compare_tokens(source):
+    '''
+    Lexes the source with both lexers, returning None if they agree or a description of the difference
+    '''
+    expected = [repr(token) for token in tokenize_multipass(source)]
+    actual = [repr(token) for token in tokenize(source)]
+    if expected != actual:
+        return 'source: {!r}\nmulti-pass: {}\nsingle pass: {}'.format(source, expected, actual)
+    return None
+
+def random_characters(rng):
+    return ''.join(rng.choice(CHARACTERS) for _ in range(rng.randint(0, 20)))
+
+class ProgramGenerator():
+    def __init__(self, rng, max_depth=3):
+        self._rng = rng
+        self._max_depth = max_depth
+
+    def program(self):
+        return ' ; '.join(self.line() for _ in range(self._rng.choice([1, 1, 1, 2])))
+
+    def line(self):
+        choice = self._rng.random()
+        if choice < 0.15:
+            return '{}({}) = {}'.format(self._rng.choice(WORDS), self.words(), self.expression(0))
+        elif choice < 0.3:
+            return '{} = {}'.format(self._rng.choice(WORDS), self.expression(0))
+        else:
+            return self.expression(0)
+
+    def words(self):
+        return ', '.join(self._rng.choice(WORDS) for _ in range(self._rng.randint(0, 2)))
+
+    def expression(self, depth):
+        if self._rng.random() < 0.05:
+            return ''
+        terms = [self.operand(depth)]
+        while self._rng.random() < 0.4:
+            terms.append(self._rng.choice(BINARY_OPERATORS))
+            terms.append(self.operand(depth))
+        return ' '.join(terms)
+
+    def operand(self, depth):
+        prefix = ''
+        while self._rng.random() < 0.15:
+            prefix += self._rng.choice(UNARY_OPERATORS) + ' '
+        terms = [self.postfix(depth)]
+        while self._rng.random() < 0.2:
+            terms.append(self.postfix(depth))
+        return prefix + ' '.join(terms)
+
+    def postfix(self, depth):
+        term = self.primary(depth)
+        while depth < self._max_depth and self._rng.random() < 0.3:
+            if self._rng.random() < 0.5:
+                term += '[{}]'.format(self.expression_list(depth + 1))
+            else:
+                term += '({})'.format(self.expression_list(depth + 1))
+        return term
+
+    def primary(self, depth):
+        choice = self._rng.random()
+        if depth >= self._max_depth or choice < 0.35:
+            return self._rng.choice(NUMBERS)
+        elif choice < 0.65:
+            name = self._rng.choice(WORDS)
+            while self._rng.random() < 0.1:
+                name += '.' + self._rng.choice(WORDS)
+            return name
+        elif choice < 0.8:
+            return '({})'.format(self.expression(depth + 1))
+        elif choice < 0.9:
+            return '[{}]'.format(self.expression_list(depth + 1))
+        else:
+            return '({})'.format(self.words())
+
+    def expression_list(self, depth):
+        return ', '.join(self.expression(depth) for _ in range(self._rng.choice([0, 1, 1, 2, 3])))
+
+def corrupt(rng, source):
+    '''
+    Inserts, deletes or replaces a random token of the source
+    '''
+    parts = source.split(' ')
+    pos = rng.randrange(len(parts) + 1)
+    choice = rng.random()
+    if choice < 0.4:
+        parts.insert(pos, rng.choice(NOISE))
+    elif pos < len(parts):
+        if choice < 0.7:
+            del parts[pos]
+        else:
+            parts[pos] = rng.choice(NOISE)
+    return ' '.join(parts)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the precedence parser and lexer against the original implementations')
+    parser.add_argument('-n', '--count', type=int, default=1000, help='number of programs to generate')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--max-depth', type=int, default=3, help='maximum bracket nesting of generated programs')
+    parser.add_argument('--max-tokens', type=int, default=40, help='skip programs with more tokens than this, since the combinators are slow on long inputs')
+    args = parser.parse_args(argv)
+    sys.setrecursionlimit(20000)
+
+    rng = random.Random(args.seed)
+    generator = ProgramGenerator(rng, max_depth=args.max_depth)
+    checked = 0
+    failures = 0
+    while checked < args.count:
+        source = generator.program()
+        if rng.random() < 0.3:
+            source = corrupt(rng, source)
+        if len(tokenize(source)) > args.max_tokens:
+            continue
+        checked += 1
+        for difference in [compare(source), compare_tokens(source), compare_tokens(random_characters(rng))]:
+            if difference is not None:
+                failures += 1
+                print(difference, end='\n\n')
+    print('{} programs checked, {} mismatches'.format(checked, failures))
+    return 1 if failures > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,269 @@
+'''
+Deterministic recursive descent parser for the calculator grammar, using precedence climbing for infix expressions.
+It produces exactly the same trees as the combinator parser in Parsers.py, but in linear time:
+each alternative is tried in the order the combinators try it, repetitions are greedy, and
+the left recursive index/function_call rules are parsed as a loop over postfix brackets.
+'''
+from Lexer import Token
+
+# Binary operators by precedence, with lower indices being evaluated first
+PRECEDENCE_OPERATORS = [
+    ('^',),
+    ('*', '/', '%'),
+    ('+', '-'),
+    ('>', '<', '>=', '<='),
+    ('!=', '==', 'eq', 'neq'),
+    ('and',),
+    ('or',),
+]
+
+def parse(tokens):
+    '''
+    Parses a list of tokens as a program.
+    Returns the position the parse stopped at and the program tree. The parse succeeded if the position is len(tokens).
+    '''
+    return PrecedenceParser(tokens).parse_program()
+
+class PrecedenceParser():
+    def __init__(self, tokens):
+        self._tokens = tokens
+        self._length = len(tokens)
+        self._expression_memo = {}
+
+    def _is_value(self, pos, value):
+        return pos < self._length and self._tokens[pos].value == value
+
+    def _is_word(self, pos):
+        return pos < self._length and Token.is_word(self._tokens[pos])
+
+    def parse_program(self):
+        line, pos = self._line(0)
+        lines = [line]
+        while self._is_value(pos, ';'):
+            line, pos = self._line(pos + 1)
+            lines.append(line)
+        return pos, ('program',) + tuple(lines)
+
+    def _line(self, pos):
+        result = self._function_def(pos)
+        if result is None:
+            result = self._var_def(pos)
+        if result is None:
+            result = self._expression(pos)
+        tree, pos = result
+        return ('line', tree), pos
+
+    def _function_def(self, pos):
+        if not (self._is_word(pos) and self._is_value(pos + 1, '(')):
+            return None
+        word_list, end = self._word_list(pos + 2)
+        if not (self._is_value(end, ')') and self._is_value(end + 1, '=')):
+            return None
+        expression, end = self._expression(end + 2)
+        return ('function_def', (self._tokens[pos],), word_list, expression), end
+
+    def _var_def(self, pos):
+        words = []
+        while self._is_word(pos) and self._is_value(pos + 1, '='):
+            words.append((self._tokens[pos],))
+            pos += 2
+        if len(words) == 0:
+            return None
+        expression, pos = self._expression(pos)
+        words.append(expression)
+        return ('var_def',) + tuple(words), pos
+
+    def _word_list(self, pos):
+        if not self._is_word(pos):
+            return ('word_list', ()), pos
+        words = [(self._tokens[pos],)]
+        pos += 1
+        while self._is_value(pos, ',') and self._is_word(pos + 1):
+            words.append((self._tokens[pos + 1],))
+            pos += 2
+        return ('word_list',) + tuple(words), pos
+
+    def _expression(self, pos):
+        '''
+        Parses an expression, which always succeeds since an expression may be empty.
+        Results are memoized because bracketed alternatives may parse the same expression twice.
+        '''
+        result = self._expression_memo.get(pos)
+        if result is None:
+            result = self._infix(len(PRECEDENCE_OPERATORS) - 1, pos)
+            if result is not None:
+                tree, end = result
+                result = ('expression', tree), end
+            elif self._is_value(pos, '('):
+                word_list, end = self._word_list(pos + 1)
+                if self._is_value(end, ')'):
+                    result = ('expression', word_list), end + 1
+            if result is None:
+                result = ('expression', ()), pos
+            self._expression_memo[pos] = result
+        return result
+
+    def _infix(self, level, pos):
+        '''
+        Parses a chain of operands joined by operators of the given precedence level.
+        A chain without any operators above level 0 is returned as is, matching the collapsed labels of the combinators.
+        '''
+        if level < 0:
+            return self._binary_operand(pos)
+        result = self._infix(level - 1, pos)
+        if result is None:
+            return None
+        tree, pos = result
+        items = [tree]
+        operators = PRECEDENCE_OPERATORS[level]
+        while pos < self._length and self._tokens[pos].value in operators:
+            result = self._infix(level - 1, pos + 1)
+            if result is None:
+                break
+            items.append(('operator', (self._tokens[pos],)))
+            items.append(result[0])
+            pos = result[1]
+        if level > 0 and len(items) == 1:
+            return tree, pos
+        return ('infix',) + tuple(items), pos
+
+    def _binary_operand(self, pos):
+        operators = []
+        while pos < self._length and Token.is_unary_operator(self._tokens[pos]):
+            operators.append(('operator', (self._tokens[pos],)))
+            pos += 1
+        result = self._unary_operand(pos)
+        if result is None:
+            return None
+        tree, pos = result
+        if len(operators) == 0 and tree[0] == 'operand':
+            return tree, pos
+        operators.append(tree)
+        return ('operand',) + tuple(operators), pos
+
+    def _unary_operand(self, pos):
+        result = self._composable_unary_operand(pos)
+        if result is None:
+            return None
+        tree, pos = result
+        operands = [tree]
+        result = self._composable_unary_operand(pos)
+        while result is not None:
+            operands.append(result[0])
+            pos = result[1]
+            result = self._composable_unary_operand(pos)
+        if len(operands) == 1:
+            return tree, pos
+        return ('implicit_mult',) + tuple(operands), pos
+
+    def _composable_unary_operand(self, pos):
+        '''
+        Parses a number, or a name, array or bracketed expression followed by any number of index and call brackets.
+        The combinators prefer the longest index over any function call, so the chain is cut after its last index if it has one.
+        '''
+        if pos >= self._length:
+            return None
+        token = self._tokens[pos]
+        if token.value == '[':
+            result = self._array(pos)
+            is_callable = False
+        elif Token.is_word(token):
+            result = self._name(pos)
+            is_callable = True
+        elif token.value == '(':
+            result = self._wrapped_expression(pos)
+            is_callable = True
+        elif Token.is_number(token):
+            return ('operand', (token,)), pos + 1
+        else:
+            return None
+        if result is None:
+            return None
+
+        node, pos = result
+        last_index = None
+        last_call = None
+        while True:
+            arrays = []
+            result = self._array(pos)
+            while result is not None:
+                arrays.append(result[0])
+                pos = result[1]
+                result = self._array(pos)
+            if len(arrays) > 0:
+                node = ('index', node) + tuple(arrays)
+                last_index = (node, pos)
+                is_callable = True
+
+            param_sets = []
+            if is_callable:
+                result = self._params(pos)
+                while result is not None:
+                    param_sets.append(result[0])
+                    pos = result[1]
+                    result = self._params(pos)
+            if len(param_sets) > 0:
+                node = ('function_call', node) + tuple(param_sets)
+                last_call = (node, pos)
+                is_callable = False
+            elif len(arrays) == 0:
+                break
+
+        if last_index is not None:
+            node, pos = last_index
+        elif last_call is not None:
+            node, pos = last_call
+        return ('operand', node), pos
+
+    def _name(self, pos):
+        words = [(self._tokens[pos],)]
+        pos += 1
+        while self._is_value(pos, '.') and self._is_word(pos + 1):
+            words.append((self._tokens[pos + 1],))
+            pos += 2
+        return ('name',) + tuple(words), pos
+
+    def _wrapped_expression(self, pos):
+        if not self._is_value(pos, '('):
+            return None
+        expression, end = self._expression(pos + 1)
+        if not self._is_value(end, ')'):
+            return None
+        return expression, end + 1
+
+    def _expression_list(self, pos):
+        expression, pos = self._expression(pos)
+        expressions = [expression]
+        while self._is_value(pos, ','):
+            expression, pos = self._expression(pos + 1)
+            expressions.append(expression)
+        if len(expressions) < 2:
+            return None
+        return tuple(expressions), pos
+
+    def _array(self, pos):
+        if not self._is_value(pos, '['):
+            return None
+        result = self._expression_list(pos + 1)
+        if result is None:
+            expression, end = self._expression(pos + 1)
+            result = (expression,), end
+        expressions, end = result
+        if not self._is_value(end, ']'):
+            return None
+        return ('array',) + expressions, end + 1
+
+    def _params(self, pos):
+        if not self._is_value(pos, '('):
+            return None
+        if self._is_value(pos + 1, ')'):
+            return ('params', ()), pos + 2
+        result = self._wrapped_expression(pos)
+        if result is not None:
+            return ('params', result[0]), result[1]
+        result = self._expression_list(pos + 1)
+        if result is not None:
+            expressions, end = result
+            if self._is_value(end, ')'):
+                return ('params',) + expressions, end + 1
+        return None
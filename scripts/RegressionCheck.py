@@ -0,0 +1,118 @@
+'''
+Checks of behavior that broke before: saves of arrays and of ans that fail to load back the same, and memoized user
+functions that lose their speed with jit on.
+Each check returns a description of what went wrong, or None if it passed.
+Run directly: python RegressionCheck.py
+'''
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+import Interpreter
+import Function
+import Journal
+from History import History
+
+def same_value(value1, value2):
+    if isinstance(value1, np.ndarray) or isinstance(value2, np.ndarray):
+        return isinstance(value1, np.ndarray) and isinstance(value2, np.ndarray) and value1.dtype == value2.dtype and \
+            value1.shape == value2.shape and all(same_value(elem1, elem2) for elem1, elem2 in zip(value1.flat, value2.flat))
+    elif isinstance(value1, float) and isinstance(value2, float) and np.isnan(value1) and np.isnan(value2):
+        return type(value1) == type(value2)
+    return type(value1) == type(value2) and value1 == value2
+
+def check_save_round_trip():
+    '''
+    Saves a scope holding arrays, a float, a function and a copy of ans, an object array, in both formats, and
+    compares it with the scope loaded back, eagerly and lazily, and after a journal checkpoint of another array
+    '''
+    interpreter = Interpreter.Interpreter.get_global_interpreter()
+    history = History(interpreter.retrieve_value('ans'))
+    for program in ['x = [1, 2, 3]', 'y = 2.5', 'm = [[1, 2], [3, 4]]', 'f(a) = a y + x']:
+        history.append(interpreter.evaluate(program))
+    interpreter.get_root_scope().set_value('ans', history.values(), force=True)
+    # ans itself is not saved, but names bound to it are
+    interpreter.evaluate('h = ans')
+    names = ['x', 'y', 'm', 'h']
+
+    directory = tempfile.mkdtemp()
+    try:
+        for ext in ['.calc', '.calcb']:
+            path = os.path.join(directory, 'save' + ext)
+            Journal.write_save(interpreter.serialize(), path)
+            for lazy in [False, True]:
+                loaded = Interpreter.Interpreter.get_global_interpreter(subscope=Journal.load_scope(path, lazy=lazy))
+                for name in names:
+                    if not same_value(interpreter.retrieve_value(name), loaded.retrieve_value(name)):
+                        return '{} save (lazy {}): {} was {!r}, loaded {!r}'.format(
+                            ext, lazy, name, interpreter.retrieve_value(name), loaded.retrieve_value(name))
+                if not same_value(loaded.evaluate('f(2)'), interpreter.evaluate('f(2)')):
+                    return '{} save (lazy {}): f(2) differs after loading'.format(ext, lazy)
+
+            scope = Journal.load_scope(path)
+            journal = Journal.Journal(path, scope)
+            Interpreter.Interpreter.get_global_interpreter(subscope=scope).evaluate('z = [0.5, 1.5]')
+            journal.checkpoint()
+            loaded = Interpreter.Interpreter.get_global_interpreter(subscope=Journal.load_scope(path))
+            if not same_value(loaded.retrieve_value('z'), np.array([0.5, 1.5])):
+                return '{} journal: z loaded as {!r}'.format(ext, loaded.retrieve_value('z'))
+    finally:
+        shutil.rmtree(directory)
+    return None
+
+def check_jit_memo():
+    '''
+    Evaluates a memoized doubly recursive function with jit on, which takes exponential time if the calls made by the
+    lowered function skip the memo
+    '''
+    previous = Function.UserFunction.jit
+    Function.UserFunction.jit = True
+    try:
+        interpreter = Interpreter.Interpreter.get_global_interpreter()
+        interpreter.evaluate('fib(n) = ifelse(n < 2, n, fib(n - 1) + fib(n - 2))')
+
+        # Every argument from 0 to 20 is computed once through the memo. Without it fib(60) would never finish.
+        interpreter.evaluate('fib(20)')
+        misses = interpreter.retrieve_value('fib').get_memo().misses
+        if misses != 21:
+            return 'fib(20) missed the memo {} times instead of 21'.format(misses)
+
+        start = time.perf_counter()
+        result = interpreter.evaluate('fib(60)')
+        elapsed = time.perf_counter() - start
+    finally:
+        Function.UserFunction.jit = previous
+    if result != 1548008755920.0:
+        return 'fib(60) was {!r}'.format(result)
+    elif elapsed > 1.0:
+        return 'fib(60) took {:.3f}s'.format(elapsed)
+    return None
+
+CHECKS = {
+    'save_round_trip': check_save_round_trip,
+    'jit_memo': check_jit_memo
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run checks of behavior that broke before')
+    parser.add_argument('--filter', help='only run checks whose name contains this')
+    args = parser.parse_args(argv)
+
+    failures = 0
+    checked = 0
+    for name, check in CHECKS.items():
+        if args.filter is not None and args.filter not in name:
+            continue
+        checked += 1
+        difference = check()
+        if difference is not None:
+            failures += 1
+            print('{}: {}'.format(name, difference))
+    print('{} checks run, {} failed'.format(checked, failures))
+    return 1 if failures > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,8 @@
 from functools import reduce
 import Interpreter
 import Function
+import Analysis
+import Operators
 import os
 import numpy as np
 
@@ -8,25 +10,69 @@ class NoNewline(Exception):
     pass
 
 class Scope():
+    # Incremented whenever a name is added to or removed from a watched scope, which invalidates every cached
+    # owner of a name (see find_owner)
+    _version = 0
+
+    # Incremented whenever any name of a watched scope is set or removed, which invalidates values derived from them
+    _generation = 0
+
+    # Names stored in slots rather than in the symbol table. Only frames have any.
+    _layout = {}
+
+    # Names set or deleted since changes were last taken, if the scope tracks its changes (see track_changes)
+    _changes = None
+
+    # Scopes of builtins, created once per process and shared by every interpreter, keyed by the interface flag
+    _builtin_scopes = {}
+
+    # Whether the scope is one of the shared builtin scopes
+    _shared = False
+
     def __init__(self, parent=None, serializable=True):
         self._parent = parent
         self._symbol_table = {}
         self._serializable = serializable
+        self._captured = False
+        self._watched = False
 
     def retrieve_value(self, name):
-        if name in self._symbol_table:
-            return self._symbol_table[name][0]
-        elif self._parent is not None:
-            return self._parent.retrieve_value(name)
-        else:
-            raise ValueError('\'{}\' is not defined'.format(name))
+        scope = self
+        while scope is not None:
+            slot = scope._layout.get(name)
+            if slot is not None:
+                return scope._slots[slot]
+            entry = scope._symbol_table.get(name)
+            if entry is not None:
+                return entry[0]
+            scope = scope._parent
+        raise ValueError('\'{}\' is not defined'.format(name))
+
+    def find_owner(self, name):
+        '''
+        Returns the closest scope defining the name, or None if it is not defined.
+        The scopes searched are marked as watched, so that the owner can be cached until Scope._version changes.
+        '''
+        scope = self
+        while scope is not None:
+            scope._watched = True
+            if name in scope._layout or name in scope._symbol_table:
+                return scope
+            scope = scope._parent
+        return None
     
     def set_value(self, name, value, mutable=True, force=False):
         current_value = self._symbol_table.get(name)
 
         # If the name is not in the symbol table or it is mutable, set it to the given value
         if not current_value or current_value[1] or force:
+            if self._watched:
+                Scope._generation += 1
+                if current_value is None:
+                    Scope._version += 1
             self._symbol_table[name] = (value, mutable)
+            if self._changes is not None:
+                self._changes.add(name)
         return value
 
     def delete_value(self, name):
@@ -34,6 +80,11 @@ class Scope():
             _, mutable = self._symbol_table[name]
             if mutable:
                 del self._symbol_table[name]
+                if self._changes is not None:
+                    self._changes.add(name)
+                if self._watched:
+                    Scope._version += 1
+                    Scope._generation += 1
                 return True
             else:
                 return False
@@ -62,7 +113,7 @@ class Scope():
             obj['symbol_table'] = {}
 
             # Populate the serializable object's symbol table
-            for key, (value, mutable) in self._symbol_table.items():
+            for key, (value, mutable) in self._items():
                 if isinstance(value, Function.Function):
                     new_path = '{}/symbol_table/{}'.format(path, key)
                     obj['symbol_table'][key] = (value.serialize(new_path, serialized), mutable)
@@ -73,19 +124,77 @@ class Scope():
             # Return the memoized path
             return serialized[self]
 
+    def track_changes(self):
+        '''
+        Starts recording the names set or deleted in this scope
+        '''
+        self._changes = set()
+
+    def take_changes(self):
+        '''
+        Returns the names set or deleted since the last call, and starts recording afresh
+        '''
+        changes = self._changes
+        self._changes = set()
+        return changes
+
+    def _items(self):
+        '''
+        Returns the (name, (value, mutable)) pairs stored in this scope
+        '''
+        return self._symbol_table.items()
+
+    def capture(self):
+        '''
+        Marks the scope and its ancestors as referenced by a function, so that they are never rebound for reuse
+        '''
+        scope = self
+        while scope is not None and not scope._captured:
+            scope._captured = True
+            scope = scope._parent
+
+    def is_captured(self):
+        return self._captured
+
     def get_root_scope(self):
-        if self._parent is None:
+        '''
+        Returns the outermost scope of an interpreter, which holds ans. The shared builtin scope above it is skipped.
+        '''
+        if self._parent is None or self._parent._shared:
             return self
         else:
             return self._parent.get_root_scope()
 
     def get_global_scope(interface=False, subscope=None):
+        scope = Scope(parent=Scope.get_builtin_scope(interface=interface), serializable=False)
+        scope.set_value('ans', np.array([np.nan], dtype=object), mutable=False)
+
+        if subscope:
+            subscope._parent = scope
+            Scope._version += 1
+            Scope._generation += 1
+            return subscope
+        else:
+            return Scope(parent=scope)
+
+    def get_builtin_scope(interface=False):
+        '''
+        Returns the scope of the builtin constants and functions, creating it on first use.
+        Every name in it is immutable, so a single scope is shared by all interpreters in the process.
+        '''
+        scope = Scope._builtin_scopes.get(interface)
+        if scope is None:
+            scope = Scope.make_builtin_scope(interface=interface)
+            scope._shared = True
+            Scope._builtin_scopes[interface] = scope
+        return scope
+
+    def make_builtin_scope(interface=False):
         scope = Scope(serializable=False)
         scope.set_value('True', True, mutable=False)
         scope.set_value('False', False, mutable=False)
         scope.set_value('pi', np.pi, mutable=False)
         scope.set_value('e', np.e, mutable=False)
-        scope.set_value('ans', np.array([np.nan], dtype=object), mutable=False)
 
         # Define the lambda function
         def lambda_def(word_list, definition):
@@ -94,47 +203,145 @@ class Scope():
                 raise ValueError('lambda expected a word list as its first argument')
             else:
                 scope = Scope(parent=word_list.get_scope())
+                scope.capture()
                 func = Function.UserFunction('<anonymous>', param_names, definition.get_AST(), scope)
                 scope.set_value('self', func, mutable=False)
                 return func
-        Function.BuiltinFunction('lambda', ['param_names', 'expression'], lambda_def).add_to(scope, mutable=False)
-
-        # Define the sum function
-        def sum_def(index, start, end, exp):
-            index_names = index.to_word_list()
-            start_val = start.eval()
-            end_val = end.eval()
-            if index_names == None or len(index_names) != 1:
-                raise ValueError('sum exprected a single word as its first argument')
+        Function.BuiltinFunction('lambda', ['param_names', 'expression'], lambda_def, pure=False).add_to(scope, mutable=False)
+
+        def to_range(start_val, end_val):
+            '''
+            Returns the range of integers from start_val to end_val inclusive, counting down if end_val is smaller
+            '''
+            try:
+                int_start_val = int(start_val)
+                int_end_val = int(end_val)
+            except TypeError:
+                raise ValueError('Start and end values must be integers')
+            if int_start_val != start_val or int_end_val != end_val:
+                raise ValueError('Start and end values must be integers')
+            if start_val <= end_val:
+                return range(int_start_val, int_end_val + 1)
             else:
-                # Create the scope and interpreter to use to evaluate the expression
-                index_name = index_names[0]
-                scope = Scope(parent=index.get_scope())
-                interpreter = Interpreter.Interpreter(scope)
-                exp = Interpreter.ExpressionWrapper(exp.get_AST(), interpreter)
-
-                # Validate start and end values
-                try:
-                    int_start_val = int(start_val)
-                    int_end_val = int(end_val)
-                except TypeError:
-                    raise ValueError('Start and end values must be integers')
-                if int_start_val != start_val or int_end_val != end_val:
-                    raise ValueError('Start and end values must be integers')
-
-                # Create the range to iterate over
-                if start_val <= end_val:
-                    r = range(int_start_val, int_end_val + 1)
+                return range(int_start_val, int_end_val - 1, -1)
+
+        def aggregate_def(name, ufunc, identity):
+            '''
+            Creates a builtin that combines the values of an expression over a range of indices with the given ufunc
+            '''
+            def _aggregate(index, start, end, exp):
+                index_names = index.to_word_list()
+                start_val = start.eval()
+                end_val = end.eval()
+                if index_names == None or len(index_names) != 1:
+                    raise ValueError('{} exprected a single word as its first argument'.format(name))
                 else:
-                    r = range(int_start_val, int_end_val - 1, -1)
+                    # Create the scope and interpreter to use to evaluate the expression
+                    index_name = index_names[0]
+                    scope = Scope(parent=index.get_scope())
+                    interpreter = Interpreter.Interpreter(scope)
+                    exp = exp.with_interpreter(interpreter)
+
+                    # Create the range to iterate over
+                    r = to_range(start_val, end_val)
+
+                    # If the expression is elementwise, evaluate it once over an array of all the indices.
+                    # The values are accumulated in order so the result matches the loop below exactly.
+                    if exp.get_AST() is not None and Analysis.is_elementwise(exp.get_AST(), scope, index_name):
+                        indices = np.arange(r.start, r.stop, r.step)
+                        scope.set_value(index_name, indices)
+                        try:
+                            values = np.broadcast_to(exp.eval(), indices.shape)
+                            return ufunc.accumulate(np.concatenate(([identity], values)))[-1]
+                        except Exception:
+                            # Let the loop evaluate the expression and raise any errors
+                            pass
+
+                    # Generate the values and combine them
+                    values = []
+                    for i in r:
+                        scope.set_value(index_name, i)
+                        values.append(exp.eval())
+                    return reduce(ufunc, values, identity)
+            return _aggregate
 
-                # Generate the values and return their sum
-                values = []
-                for i in r:
-                    scope.set_value(index_name, i)
-                    values.append(exp.eval())
-                return reduce(np.add, values, 0)
-        Function.BuiltinFunction('sum', ['index', 'start', 'end', 'expression'], sum_def).add_to(scope, mutable=False)
+        # Define the sum function
+        Function.BuiltinFunction('sum', ['index', 'start', 'end', 'expression'], aggregate_def('sum', np.add, 0)).add_to(scope, mutable=False)
+
+        # Define the prod function
+        Function.BuiltinFunction('prod', ['index', 'start', 'end', 'expression'], aggregate_def('prod', np.multiply, 1)).add_to(scope, mutable=False)
+
+        # Define the range function
+        def range_def(start, end):
+            r = to_range(start.eval(), end.eval())
+            return np.arange(r.start, r.stop, r.step, dtype=np.float64)
+        Function.BuiltinFunction('range', ['start', 'end'], range_def).add_to(scope, mutable=False)
+
+        def get_function(name, func):
+            value = func.eval()
+            if not isinstance(value, Function.Function):
+                raise ValueError('{} expected a function as its first argument'.format(name))
+            return value
+
+        def get_array(name, array, position):
+            value = array.eval()
+            if not isinstance(value, np.ndarray) or value.ndim == 0:
+                raise ValueError('{} expected an array as its {} argument'.format(name, position))
+            return value
+
+        def apply_elementwise(func, array, scope):
+            '''
+            Calls a single parameter function once on a whole numeric array if its definition is elementwise,
+            which gives the same values as calling it on each element. Returns None if this is not possible.
+            '''
+            if array.dtype.kind not in 'biuf' or not Analysis.is_elementwise_function(func):
+                return None
+            try:
+                values = next(func.call_each([[array]], scope))
+                return np.array(np.broadcast_to(values, array.shape))
+            except Exception:
+                # Let the caller loop over the elements and raise any errors
+                return None
+
+        # Define the map function
+        def map_def(func, array):
+            func = get_function('map', func)
+            scope = array.get_scope()
+            array = get_array('map', array, 'second')
+            values = apply_elementwise(func, array, scope)
+            if values is None:
+                values = np.array(list(func.call_each(([elem] for elem in array), scope)))
+            return values
+        Function.BuiltinFunction('map', ['function', 'array'], map_def).add_to(scope, mutable=False)
+
+        # Define the filter function
+        def filter_def(func, array):
+            func = get_function('filter', func)
+            scope = array.get_scope()
+            array = get_array('filter', array, 'second')
+            if array.ndim == 1:
+                keep = apply_elementwise(func, array, scope)
+                if keep is not None:
+                    return array[keep.astype(bool)]
+            keep = func.call_each(([elem] for elem in array), scope)
+            return np.array([elem for elem, kept in zip(array, keep) if kept])
+        Function.BuiltinFunction('filter', ['function', 'array'], filter_def).add_to(scope, mutable=False)
+
+        # Define the reduce function
+        def reduce_def(func, array, initial):
+            func = get_function('reduce', func)
+            scope = array.get_scope()
+            array = get_array('reduce', array, 'second')
+            accumulator = [initial.eval()]
+
+            # Each call's arguments depend on the previous result, so the rows are generated as the results arrive
+            def rows():
+                for elem in array:
+                    yield [accumulator[0], elem]
+            for result in func.call_each(rows(), scope):
+                accumulator[0] = result
+            return accumulator[0]
+        Function.BuiltinFunction('reduce', ['function', 'array', 'initial'], reduce_def).add_to(scope, mutable=False)
 
         # Define the delete function
         def delete_def(word_list):
@@ -143,11 +350,11 @@ class Scope():
                 raise ValueError('delete expected a single word as its first argument')
             else:
                 return word_list.get_scope().delete_value(words[0])
-        Function.BuiltinFunction('delete', ['name'], delete_def).add_to(scope, mutable=False)
+        Function.BuiltinFunction('delete', ['name'], delete_def, pure=False).add_to(scope, mutable=False)
 
         # Define the ifelse function
         Function.BuiltinFunction('ifelse', ['condition', 'expression_true', 'expression_false'],
-            lambda c, e_t, e_f: e_t.eval() if c.eval() else e_f.eval()
+            lambda c, e_t, e_f: e_t.eval() if c.eval() else e_f.eval(), tail_params=(1, 2)
         ).add_to(scope, mutable=False)
 
         # Define the len function
@@ -157,69 +364,78 @@ class Scope():
 
         # Define the sin function
         Function.BuiltinFunction('sin', ['theta'],
-            lambda theta: np.sin(theta.eval())
+            lambda theta: Operators.sin(theta.eval()), elementwise=True
         ).add_to(scope, mutable=False)
 
         # Define the cos function
         Function.BuiltinFunction('cos', ['theta'],
-            lambda theta: np.cos(theta.eval())
+            lambda theta: Operators.cos(theta.eval()), elementwise=True
         ).add_to(scope, mutable=False)
 
         # Define the tan function
         Function.BuiltinFunction('tan', ['theta'],
-            lambda theta: np.tan(theta.eval())
+            lambda theta: np.tan(theta.eval()), elementwise=True
         ).add_to(scope, mutable=False)
 
         # Define the arcsin function
         Function.BuiltinFunction('arcsin', ['x'],
-            lambda x: np.arcsin(x.eval())
+            lambda x: np.arcsin(x.eval()), elementwise=True
         ).add_to(scope, mutable=False)
 
         # Define the arccos function
         Function.BuiltinFunction('arccos', ['x'],
-            lambda x: np.arccos(x.eval())
+            lambda x: np.arccos(x.eval()), elementwise=True
         ).add_to(scope, mutable=False)
 
         # Define the arctan function
         Function.BuiltinFunction('arctan', ['x'],
-            lambda x: np.arctan(x.eval())
+            lambda x: np.arctan(x.eval()), elementwise=True
         ).add_to(scope, mutable=False)
 
         # Define the arctan2 function
         Function.BuiltinFunction('arctan2', ['y', 'x'],
-            lambda y, x: np.arctan2(y.eval(), x.eval())
+            lambda y, x: np.arctan2(y.eval(), x.eval()), elementwise=True
         ).add_to(scope, mutable=False)
 
         # Define the sqrt function
         Function.BuiltinFunction('sqrt', ['x'],
-            lambda x: np.sqrt(x.eval())
+            lambda x: Operators.sqrt(x.eval()), elementwise=True
         ).add_to(scope, mutable=False)
 
         # Define the exp function
         Function.BuiltinFunction('exp', ['x'],
-            lambda x: np.exp(x.eval())
+            lambda x: np.exp(x.eval()), elementwise=True
         ).add_to(scope, mutable=False)
 
         # Define the ln function
         Function.BuiltinFunction('ln', ['x'],
-            lambda x: np.log(x.eval())
+            lambda x: np.log(x.eval()), elementwise=True
         ).add_to(scope, mutable=False)
 
         # Define the log function
         Function.BuiltinFunction('log', ['x'],
-            lambda x: np.log(x.eval()) / np.log(10)
+            lambda x: Operators.log(x.eval()), elementwise=True
         ).add_to(scope, mutable=False)
 
         # Define the log2 function
         Function.BuiltinFunction('log2', ['x'],
-            lambda x: np.log2(x.eval())
+            lambda x: np.log2(x.eval()), elementwise=True
         ).add_to(scope, mutable=False)
 
         # Define the log function
         Function.BuiltinFunction('logb', ['x', 'b'],
-            lambda x, b: np.log(x.eval()) / np.log(b.eval())
+            lambda x, b: Operators.logb(x.eval(), b.eval()), elementwise=True
         ).add_to(scope, mutable=False)
 
+        # Define the memo_stats function
+        def memo_stats_def(func):
+            func = get_function('memo_stats', func)
+            memo = func.get_memo() if isinstance(func, Function.UserFunction) else None
+            if memo is None:
+                return np.zeros(4)
+            return memo.stats()
+        Function.BuiltinFunction('memo_stats', ['function'], memo_stats_def, pure=False).add_to(scope, mutable=False)
+
         Function.BuiltinFunction('zeros', ['dims'],
             lambda dims: np.zeros(Interpreter.Interpreter.to_ints(dims.eval(), 'dimensions must be integers'))
         ).add_to(scope, mutable=False)
@@ -228,7 +444,7 @@ class Scope():
             def exit():
                 raise KeyboardInterrupt('Exiting the program...')
             # Define the exit function
-            Function.BuiltinFunction('exit', [], exit).add_to(scope, mutable=False)
+            Function.BuiltinFunction('exit', [], exit, pure=False).add_to(scope, mutable=False)
 
             def clear():
                 print('')
@@ -237,13 +453,8 @@ class Scope():
                 else:
                     _ = os.system('clear')
                 raise NoNewline()
-            Function.BuiltinFunction('clear', [], clear).add_to(scope, mutable=False)
-
-        if subscope:
-            subscope._parent = scope
-            return subscope
-        else:
-            return Scope(parent=scope)
+            Function.BuiltinFunction('clear', [], clear, pure=False).add_to(scope, mutable=False)
+        return scope
     
     def deserialize(obj, path, deserialized):
         if path not in deserialized:
@@ -260,20 +471,180 @@ class Scope():
                 parent = Scope.deserialize(parent, new_path, deserialized)
             scope._parent = parent
 
-            # Create the scope's symbol table
-            symbol_table = {}
-            for key, (value, mutable) in obj['symbol_table'].items():
-                if type(value) == str:
-                    symbol_table[key] = (deserialized[value], mutable)
-                elif type(value) == float:
-                    symbol_table[key] = (np.float(value), mutable)
-                elif type(value) == dict:
-                    new_path = '{}/symbol_table/{}'.format(path, key)
-                    func = Function.UserFunction.deserialize(value, new_path, deserialized)
-                    symbol_table[key] = (func, mutable)
-                else:
-                    symbol_table[key] = (value, mutable)
+            # Create the scope's symbol table, leaving its entries to be deserialized on first use if loading lazily
+            if isinstance(deserialized, LazyPaths):
+                symbol_table = LazySymbolTable(obj['symbol_table'], path, deserialized)
+            else:
+                symbol_table = {}
+                for key, entry in obj['symbol_table'].items():
+                    symbol_table[key] = Scope.deserialize_entry(entry, '{}/symbol_table/{}'.format(path, key), deserialized)
             scope._symbol_table = symbol_table
             return scope
         else:
-            return deserialized[path]
\ No newline at end of file
+            return deserialized[path]
+
+    def deserialize_entry(entry, path, deserialized):
+        value, mutable = entry
+        if type(value) == str:
+            return (deserialized[value], mutable)
+        elif type(value) == float:
+            return (float(value), mutable)
+        elif type(value) == dict:
+            return (Function.UserFunction.deserialize(value, path, deserialized), mutable)
+        else:
+            return (value, mutable)
+
+class LazyPaths(dict):
+    '''
+    The objects deserialized so far from a serialized scope, keyed by their paths.
+    Looking up a path that has not been deserialized yet deserializes the object it leads to, so the objects of a
+    save can be deserialized in any order.
+    '''
+    def __init__(self, obj):
+        super().__init__()
+        self._obj = obj
+
+    def __missing__(self, path):
+        # Follow the path from the root of the serialized scope to the object it was serialized at
+        parts = path.split('/')
+        obj = self._obj
+        i = 1
+        while i < len(parts):
+            if parts[i] == 'symbol_table':
+                obj = obj['symbol_table'][parts[i + 1]][0]
+                i += 2
+            else:
+                obj = obj[parts[i]]
+                i += 1
+
+        if parts[-1] == 'definition':
+            self[path] = Function.deserialize_AST(obj)
+        elif len(parts) > 2 and parts[-2] == 'symbol_table':
+            Function.UserFunction.deserialize(obj, path, self)
+        else:
+            Scope.deserialize(obj, path, self)
+        return dict.__getitem__(self, path)
+
+class LazySymbolTable(dict):
+    '''
+    The symbol table of a scope loaded lazily from a save. Entries stay serialized until they are first looked up,
+    so loading a save only costs as much as the names a session actually uses.
+    Iterating over the table deserializes every entry.
+    '''
+    def __init__(self, serialized_table, path, deserialized):
+        super().__init__()
+        self._pending = dict(serialized_table)
+        self._path = path
+        self._deserialized = deserialized
+
+    def _load(self, name):
+        entry = Scope.deserialize_entry(self._pending.pop(name), '{}/symbol_table/{}'.format(self._path, name), self._deserialized)
+        dict.__setitem__(self, name, entry)
+        return entry
+
+    def _load_all(self):
+        for name in list(self._pending):
+            self._load(name)
+
+    def __missing__(self, name):
+        if name in self._pending:
+            return self._load(name)
+        raise KeyError(name)
+
+    def get(self, name, default=None):
+        entry = dict.get(self, name)
+        if entry is None and name in self._pending:
+            return self._load(name)
+        return default if entry is None else entry
+
+    def __contains__(self, name):
+        return dict.__contains__(self, name) or name in self._pending
+
+    def __setitem__(self, name, entry):
+        self._pending.pop(name, None)
+        dict.__setitem__(self, name, entry)
+
+    def __delitem__(self, name):
+        if name in self._pending:
+            del self._pending[name]
+        else:
+            dict.__delitem__(self, name)
+
+    def __len__(self):
+        return dict.__len__(self) + len(self._pending)
+
+    def __iter__(self):
+        self._load_all()
+        return dict.__iter__(self)
+
+    def keys(self):
+        self._load_all()
+        return dict.keys(self)
+
+    def values(self):
+        self._load_all()
+        return dict.values(self)
+
+    def items(self):
+        self._load_all()
+        return dict.items(self)
+
+class Frame(Scope):
+    '''
+    The scope of a single user function call. The function itself and its parameters are stored in a list of slots
+    whose indices are fixed by the function's parameter names, so binding arguments does not touch a dictionary.
+    Frames are recycled by their function once the call returns, unless a lambda captured them.
+    Each frame owns the interpreter that evaluates the function's definition in it.
+    '''
+    def __init__(self, function, layout):
+        super().__init__(parent=function.get_parent_scope())
+        self._function = function
+        self._layout = layout
+        self._slots = [function] + [None] * len(function.get_param_names())
+        self.interpreter = Interpreter.Interpreter(self)
+
+    def make_layout(param_names):
+        '''
+        Maps each name in a function's scope to its slot. Slot 0 holds the function as self, and the first of any
+        repeated parameter names wins, matching the behaviour of immutable values in a scope.
+        '''
+        layout = {'self': 0}
+        for i, name in enumerate(param_names):
+            if name not in layout:
+                layout[name] = i + 1
+        return layout
+
+    def bind(self, values):
+        self._slots[1:] = values
+
+    def reset(self, parent):
+        '''
+        Prepares a released frame for another call
+        '''
+        if self._watched and (parent is not self._parent or self._symbol_table):
+            Scope._version += 1
+            Scope._generation += 1
+        self._parent = parent
+        slots = self._slots
+        for i in range(1, len(slots)):
+            slots[i] = None
+        if self._symbol_table:
+            self._symbol_table = {}
+
+    def set_value(self, name, value, mutable=True, force=False):
+        slot = self._layout.get(name)
+        if slot is None:
+            return super().set_value(name, value, mutable=mutable, force=force)
+        if force:
+            self._slots[slot] = value
+        return value
+
+    def delete_value(self, name):
+        if name in self._layout:
+            return False
+        return super().delete_value(name)
+
+    def _items(self):
+        items = [(name, (self._slots[slot], False)) for name, slot in self._layout.items()]
+        items.extend(self._symbol_table.items())
+        return items
@@ -1,5 +1,6 @@
 import base64
 import json
+import os
 import numpy as np
 from Lexer import Token
 
@@ -12,7 +13,7 @@ class ProgramEncoder(json.JSONEncoder):
         If input object is an ndarray, it will be converted into a dict holding dtype, shape, and the data base 64 encoded.
         '''
         if isinstance(obj, np.ndarray):
-            if obj.dtype == np.object:
+            if obj.dtype == object:
                 data = obj.tolist()
             else:
                 data = base64.b64encode(np.ascontiguousarray(obj).data).decode('ascii')
@@ -40,4 +41,154 @@ def json_program_obj_hook(dct):
                 return np.frombuffer(data, dct['dtype']).reshape(dct['shape'])
         elif 'type' in dct:
             return Token(dct['type'], dct['value'])
-    return dct
\ No newline at end of file
+    return dct
+
+def plain_value(value):
+    '''
+    Converts a value computed by the calculator into numbers, booleans, strings, lists and None for JSON output.
+    Infinities and NaN become the strings the calculator reads them as, and functions become their description.
+    '''
+    if value is None or isinstance(value, (bool, np.bool_)):
+        return None if value is None else bool(value)
+    elif isinstance(value, (int, np.integer)):
+        return int(value)
+    elif isinstance(value, (float, np.floating)):
+        if np.isnan(value):
+            return 'NaN'
+        elif np.isinf(value):
+            return 'Inf' if value > 0 else '-Inf'
+        return float(value)
+    elif isinstance(value, np.ndarray):
+        if value.ndim == 0:
+            return plain_value(value[()])
+        return [plain_value(elem) for elem in value]
+    else:
+        return str(value)
+
+# Binary save files start with this, followed by the length of the header as an 8 byte little endian integer and the
+# header itself, which is the save encoded as JSON with every numeric array replaced by a reference to its data.
+# Array data follows the header, each aligned to ARRAY_ALIGNMENT bytes so it can be memory mapped and used in place.
+BINARY_MAGIC = b'CALCB\x00\x01\n'
+ARRAY_ALIGNMENT = 64
+
+def align(offset):
+    return -(-offset // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+
+class BinaryEncoder(ProgramEncoder):
+    '''
+    Encodes numeric arrays as references to the data section of a binary save, collecting the arrays in order
+    '''
+    def __init__(self, *args, arrays=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.arrays = arrays
+        self.data_length = 0
+
+    def default(self, obj):
+        if isinstance(obj, np.ndarray) and obj.dtype != object:
+            obj = np.ascontiguousarray(obj)
+            offset = align(self.data_length)
+            self.arrays.append((offset, obj))
+            self.data_length = offset + obj.nbytes
+            return {
+                '__buffer__': offset,
+                'dtype': obj.dtype.str,
+                'shape': obj.shape
+            }
+        return ProgramEncoder.default(self, obj)
+
+def dump_binary(obj, f):
+    '''
+    Writes a serialized scope to a file opened in binary mode
+    '''
+    arrays = []
+    header = json.dumps(obj, cls=BinaryEncoder, arrays=arrays, separators=(',', ':')).encode('utf-8')
+    f.write(BINARY_MAGIC)
+    f.write(len(header).to_bytes(8, 'little'))
+    f.write(header)
+    data_start = align(len(BINARY_MAGIC) + 8 + len(header))
+    position = len(BINARY_MAGIC) + 8 + len(header)
+    for offset, array in arrays:
+        f.write(bytes(data_start + offset - position))
+        f.write(array.data)
+        position = data_start + offset + array.nbytes
+
+def load_binary(path):
+    '''
+    Reads a serialized scope from a binary save. Array data is memory mapped rather than read, so arrays are
+    read only, and only the parts of them that are used are ever loaded from disk.
+    '''
+    with open(path, 'rb') as f:
+        if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError('{} is not a binary save file'.format(path))
+        header_length = int.from_bytes(f.read(8), 'little')
+        header = f.read(header_length)
+    if len(header) != header_length:
+        raise ValueError('{} is truncated'.format(path))
+    data_start = align(len(BINARY_MAGIC) + 8 + header_length)
+    data = None
+    if os.path.getsize(path) > data_start:
+        data = np.memmap(path, dtype=np.uint8, mode='r', offset=data_start)
+
+    def binary_obj_hook(dct):
+        if '__buffer__' in dct:
+            dtype = np.dtype(dct['dtype'])
+            count = int(np.prod(dct['shape']))
+            if count == 0 or data is None:
+                array = np.empty(dct['shape'], dtype=dtype)
+                array.flags.writeable = False
+                return array
+            return np.frombuffer(data, dtype=dtype, count=count, offset=dct['__buffer__']).reshape(dct['shape'])
+        return json_program_obj_hook(dct)
+
+    return json.loads(header.decode('utf-8'), object_hook=binary_obj_hook)
+
+def is_binary(path):
+    with open(path, 'rb') as f:
+        return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+def load_save(path):
+    '''
+    Reads a serialized scope from a save file in either format
+    '''
+    if is_binary(path):
+        return load_binary(path)
+    with open(path, 'r') as f:
+        return json.load(f, object_hook=json_program_obj_hook)
+
+def fsync_directory(path):
+    '''
+    Flushes the directory holding a path, so that a file replaced there stays replaced after a crash
+    '''
+    if os.name != 'posix':
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def dump_save(obj, path):
+    '''
+    Writes a serialized scope to a save file, in the binary format if the path ends with .calcb and as JSON otherwise.
+    The save is written to a temporary file that replaces it once it is on disk, so a failed save leaves the old one,
+    and arrays memory mapped from the old save stay readable while the new one is written.
+    '''
+    name, ext = os.path.splitext(path)
+    temp_path = '{}.tmp{}'.format(name, ext)
+    try:
+        if ext == '.calcb':
+            with open(temp_path, 'wb') as f:
+                dump_binary(obj, f)
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            with open(temp_path, 'w') as f:
+                json.dump(obj, f, cls=ProgramEncoder)
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        fsync_directory(path)
+    except BaseException:
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+        raise
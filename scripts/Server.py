@@ -0,0 +1,194 @@
+'''
+Evaluation service over a Unix socket or a local TCP port, speaking line delimited JSON.
+Each connection is a session with its own scope, taken from a pool of interpreters that are set up ahead of time.
+Requests are JSON objects on a line of their own, with an optional id that is copied to the response:
+    {"op": "evaluate", "source": "f(x) = x^2 ; f(3)"}      evaluates a program, recording its answer in ans
+    {"op": "define", "name": "x", "value": [1, 2]}          binds a name to a JSON number, boolean or list
+    {"op": "retrieve", "name": "x"}                         returns the value of a name
+    {"op": "close"}                                         ends the session
+Responses are {"ok": true, "result": ...} or {"ok": false, "error": "..."}. Request lines longer than the server's
+request limit, 16 MiB by default, are skipped with an error response.
+Run directly: python Server.py --unix /tmp/calculator.sock, or: python Server.py --port 8765
+'''
+import argparse
+import asyncio
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import Interpreter
+import Journal
+from History import History
+from Parallel import to_value
+from Serialize import load_save, plain_value
+
+class InterpreterPool():
+    '''
+    Interpreters ready to start a session, optionally with the scope of a save file.
+    Interpreters are not reused after a session, since their scope holds what the session defined.
+    '''
+    def __init__(self, size, load_path=None):
+        self._size = size
+        self._load_path = load_path
+        self._saved = None
+        if load_path is not None:
+            self._saved = load_save(load_path)
+        self._idle = []
+        self.refill()
+
+    def _create(self):
+        if self._saved is None:
+            return Interpreter.Interpreter.get_global_interpreter()
+        scope = Interpreter.Interpreter.deserialize(self._saved, lazy=True)
+        Journal.replay(self._load_path, scope, Journal.get_save_id(self._saved))
+        return Interpreter.Interpreter.get_global_interpreter(subscope=scope)
+
+    def acquire(self):
+        if len(self._idle) > 0:
+            return self._idle.pop()
+        return self._create()
+
+    def refill(self):
+        while len(self._idle) < self._size:
+            self._idle.append(self._create())
+
+class Session():
+    def __init__(self, interpreter, history_length=None):
+        self._interpreter = interpreter
+        self._history = History(interpreter.retrieve_value('ans'), maxlen=history_length)
+        self.closed = False
+
+    def handle(self, request):
+        '''
+        Carries out a request, returning the response
+        '''
+        if type(request) != dict:
+            return {'ok': False, 'error': 'A request must be a JSON object'}
+        op = request.get('op')
+        try:
+            if op == 'evaluate':
+                result = self._evaluate(Session.get_field(request, 'source'))
+            elif op == 'define':
+                result = self._interpreter.set_value(Session.get_field(request, 'name'), to_value(Session.get_field(request, 'value')))
+            elif op == 'retrieve':
+                result = self._interpreter.retrieve_value(Session.get_field(request, 'name'))
+            elif op == 'close':
+                self.closed = True
+                result = None
+            else:
+                raise ValueError('Unknown operation \'{}\''.format(op))
+        except Exception as err:
+            return {'ok': False, 'error': str(err) if str(err) != '' else type(err).__name__}
+        return {'ok': True, 'result': plain_value(result)}
+
+    def get_field(request, name):
+        if name not in request:
+            raise ValueError('Missing field \'{}\''.format(name))
+        return request[name]
+
+    def _evaluate(self, source):
+        try:
+            result = self._interpreter.evaluate(source)
+        except Exception:
+            self._record(None)
+            raise
+        self._record(result)
+        return result
+
+    def _record(self, result):
+        self._history.append(np.nan if result is None else result)
+        self._interpreter.get_root_scope().set_value('ans', self._history.values(), force=True)
+
+class Server():
+    '''
+    Evaluation runs on a single worker thread, one request at a time, so the event loop stays free to accept
+    connections and read requests while a long evaluation runs
+    '''
+    def __init__(self, pool, history_length=None, request_limit=16 * 1024 * 1024):
+        self._pool = pool
+        self._history_length = history_length
+        self._request_limit = request_limit
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def read_line(reader):
+        '''
+        Returns the next line, or the rest of the stream at its end. A line longer than the limit is left unread and
+        raises LimitOverrunError, unlike readline, which drops part of it.
+        '''
+        try:
+            return await reader.readuntil(b'\n')
+        except asyncio.IncompleteReadError as err:
+            return err.partial
+
+    async def skip_line(reader):
+        '''
+        Discards a line that was too long to read, so the next request starts on the following line
+        '''
+        while True:
+            try:
+                await reader.readuntil(b'\n')
+                return
+            except asyncio.LimitOverrunError as err:
+                await reader.readexactly(max(err.consumed, 1))
+            except asyncio.IncompleteReadError:
+                return
+
+    async def handle_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        session = Session(self._pool.acquire(), history_length=self._history_length)
+        try:
+            while not session.closed:
+                try:
+                    line = await Server.read_line(reader)
+                except asyncio.LimitOverrunError:
+                    await Server.skip_line(reader)
+                    request = None
+                    response = {'ok': False, 'error': 'Request too long'}
+                else:
+                    if not line:
+                        break
+                    try:
+                        request = json.loads(line)
+                    except ValueError:
+                        request = None
+                        response = {'ok': False, 'error': 'Invalid JSON'}
+                    else:
+                        response = await loop.run_in_executor(self._executor, session.handle, request)
+                if type(request) == dict and 'id' in request:
+                    response['id'] = request['id']
+                writer.write((json.dumps(response) + '\n').encode('utf-8'))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            # Prepare a fresh interpreter for the next session
+            loop.run_in_executor(self._executor, self._pool.refill)
+
+    async def serve(self, unix_path=None, host='127.0.0.1', port=8765):
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix_path, limit=self._request_limit)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host=host, port=port, limit=self._request_limit)
+        async with server:
+            await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve calculator sessions over a local socket')
+    parser.add_argument('--unix', help='path of a Unix socket to listen on instead of a TCP port')
+    parser.add_argument('--host', default='127.0.0.1', help='TCP host to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='TCP port to listen on')
+    parser.add_argument('--pool', type=int, default=4, help='number of interpreters kept ready for new sessions')
+    parser.add_argument('-l', '--load', help='save file whose scope each session starts from')
+    args = parser.parse_args(argv)
+
+    sys.setrecursionlimit(3000)
+    server = Server(InterpreterPool(args.pool, load_path=args.load))
+    try:
+        asyncio.run(server.serve(unix_path=args.unix, host=args.host, port=args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())